@@ -3,6 +3,8 @@ import json
 import logging
 from typing import Any, Optional
 
+from psycopg2.extras import execute_values
+
 from app.db.connection import get_connection
 
 logger = logging.getLogger(__name__)
@@ -152,6 +154,21 @@ def append_ticket_tool_call(ticket_id: str, tool_call: dict) -> None:
             )
 
 
+def append_ticket_tool_calls(ticket_id: str, tool_calls: list[dict]) -> None:
+    """Append several tool call records to tool_calls_made in one UPDATE."""
+    if not tool_calls:
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """UPDATE tickets
+                   SET tool_calls_made = COALESCE(tool_calls_made, '[]'::jsonb) || %s::jsonb,
+                       updated_at = NOW()
+                   WHERE ticket_id = %s""",
+                (json.dumps(tool_calls, default=str), ticket_id),
+            )
+
+
 def save_ticket_transcript(ticket_id: str, transcript: str, ended_reason: str) -> None:
     """Save the call transcript and update the final result with full call details."""
     ticket = get_ticket(ticket_id)
@@ -197,16 +214,14 @@ def save_product(ticket_id: str, product: dict[str, Any]) -> int:
             return cur.fetchone()[0]
 
 
-def get_product(ticket_id: str) -> Optional[dict[str, Any]]:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT id, product_name, product_category, product_specs,
-                          avg_price_online, alternatives, store_search_query
-                   FROM ticket_products WHERE ticket_id = %s ORDER BY id DESC LIMIT 1""",
-                (ticket_id,),
-            )
-            row = cur.fetchone()
+def _read_product(cur, ticket_id: str) -> Optional[dict[str, Any]]:
+    cur.execute(
+        """SELECT id, product_name, product_category, product_specs,
+                  avg_price_online, alternatives, store_search_query
+           FROM ticket_products WHERE ticket_id = %s ORDER BY id DESC LIMIT 1""",
+        (ticket_id,),
+    )
+    row = cur.fetchone()
     if not row:
         return None
     return {
@@ -216,6 +231,12 @@ def get_product(ticket_id: str) -> Optional[dict[str, Any]]:
     }
 
 
+def get_product(ticket_id: str) -> Optional[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return _read_product(cur, ticket_id)
+
+
 # ---------------------------------------------------------------------------
 # Stores
 # ---------------------------------------------------------------------------
@@ -263,18 +284,16 @@ def update_store_priorities(ticket_id: str, ordered_place_ids: list[str]) -> Non
                 )
 
 
-def get_stores(ticket_id: str) -> list[dict[str, Any]]:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT DISTINCT ON (place_id)
-                          id, store_name, address, phone_number, rating, total_ratings,
-                          place_id, call_priority
-                   FROM ticket_stores WHERE ticket_id = %s
-                   ORDER BY place_id, call_priority, id""",
-                (ticket_id,),
-            )
-            rows = cur.fetchall()
+def _read_stores(cur, ticket_id: str) -> list[dict[str, Any]]:
+    cur.execute(
+        """SELECT DISTINCT ON (place_id)
+                  id, store_name, address, phone_number, rating, total_ratings,
+                  place_id, call_priority
+           FROM ticket_stores WHERE ticket_id = %s
+           ORDER BY place_id, call_priority, id""",
+        (ticket_id,),
+    )
+    rows = cur.fetchall()
     stores = [
         {"id": r[0], "store_name": r[1], "address": r[2], "phone_number": r[3],
          "rating": float(r[4]) if r[4] else None, "total_ratings": r[5],
@@ -285,6 +304,12 @@ def get_stores(ticket_id: str) -> list[dict[str, Any]]:
     return stores
 
 
+def get_stores(ticket_id: str) -> list[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return _read_stores(cur, ticket_id)
+
+
 # ---------------------------------------------------------------------------
 # Store calls
 # ---------------------------------------------------------------------------
@@ -342,7 +367,8 @@ def save_store_call_transcript(
     vapi_call_id: str,
     transcript: str,
     transcript_messages: list[dict] | None = None,
-) -> Optional[int]:
+) -> Optional[dict[str, Any]]:
+    """Store the transcript and return the row's id, ticket_id and raw tool calls."""
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -351,7 +377,8 @@ def save_store_call_transcript(
                        transcript_json = %s,
                        status = 'transcript_received',
                        updated_at = NOW()
-                   WHERE vapi_call_id = %s RETURNING id""",
+                   WHERE vapi_call_id = %s
+                   RETURNING id, ticket_id, tool_calls_raw""",
                 (
                     transcript,
                     json.dumps(transcript_messages, default=str) if transcript_messages else None,
@@ -359,7 +386,9 @@ def save_store_call_transcript(
                 ),
             )
             row = cur.fetchone()
-    return row[0] if row else None
+    if not row:
+        return None
+    return {"id": row[0], "ticket_id": row[1], "tool_calls_raw": row[2] or []}
 
 
 def save_store_call_analysis(call_id: int, analysis: dict[str, Any]) -> None:
@@ -412,22 +441,20 @@ def save_store_call_tool_calls(vapi_call_id: str, tool_calls: list[dict]) -> Non
             )
 
 
-def get_store_calls_for_ticket(ticket_id: str) -> list[dict[str, Any]]:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT sc.id, sc.store_id, sc.vapi_call_id, sc.status,
-                          sc.product_available, sc.matched_product, sc.price,
-                          sc.delivery_available, sc.delivery_eta, sc.delivery_mode,
-                          sc.delivery_charge, sc.product_match_type, sc.notes,
-                          sc.call_analysis, ts.store_name, ts.phone_number, ts.rating,
-                          ts.address, sc.transcript, sc.transcript_json
-                   FROM store_calls sc
-                   JOIN ticket_stores ts ON ts.id = sc.store_id
-                   WHERE sc.ticket_id = %s ORDER BY ts.call_priority""",
-                (ticket_id,),
-            )
-            rows = cur.fetchall()
+def _read_store_calls(cur, ticket_id: str) -> list[dict[str, Any]]:
+    cur.execute(
+        """SELECT sc.id, sc.store_id, sc.vapi_call_id, sc.status,
+                  sc.product_available, sc.matched_product, sc.price,
+                  sc.delivery_available, sc.delivery_eta, sc.delivery_mode,
+                  sc.delivery_charge, sc.product_match_type, sc.notes,
+                  sc.call_analysis, ts.store_name, ts.phone_number, ts.rating,
+                  ts.address, sc.transcript, sc.transcript_json
+           FROM store_calls sc
+           JOIN ticket_stores ts ON ts.id = sc.store_id
+           WHERE sc.ticket_id = %s ORDER BY ts.call_priority""",
+        (ticket_id,),
+    )
+    rows = cur.fetchall()
     return [
         {
             "id": r[0], "store_id": r[1], "vapi_call_id": r[2], "status": r[3],
@@ -445,6 +472,12 @@ def get_store_calls_for_ticket(ticket_id: str) -> list[dict[str, Any]]:
     ]
 
 
+def get_store_calls_for_ticket(ticket_id: str) -> list[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return _read_store_calls(cur, ticket_id)
+
+
 def get_store_by_id(store_id: int) -> Optional[dict[str, Any]]:
     """Get full store details including lat/lng by internal store ID."""
     with get_connection() as conn:
@@ -544,17 +577,15 @@ def save_web_deals(ticket_id: str, result: dict[str, Any]) -> int:
             return cur.fetchone()[0]
 
 
-def get_web_deals(ticket_id: str) -> Optional[dict[str, Any]]:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT id, product_searched, search_summary, deals, best_deal,
-                          surprise_finds, price_range, grounding_metadata, status,
-                          error_message, created_at
-                   FROM web_deals WHERE ticket_id = %s ORDER BY id DESC LIMIT 1""",
-                (ticket_id,),
-            )
-            row = cur.fetchone()
+def _read_web_deals(cur, ticket_id: str) -> Optional[dict[str, Any]]:
+    cur.execute(
+        """SELECT id, product_searched, search_summary, deals, best_deal,
+                  surprise_finds, price_range, grounding_metadata, status,
+                  error_message, created_at
+           FROM web_deals WHERE ticket_id = %s ORDER BY id DESC LIMIT 1""",
+        (ticket_id,),
+    )
+    row = cur.fetchone()
     if not row:
         return None
     return {
@@ -572,6 +603,12 @@ def get_web_deals(ticket_id: str) -> Optional[dict[str, Any]]:
     }
 
 
+def get_web_deals(ticket_id: str) -> Optional[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return _read_web_deals(cur, ticket_id)
+
+
 # ---------------------------------------------------------------------------
 # LLM logs
 # ---------------------------------------------------------------------------
@@ -598,6 +635,31 @@ def log_llm_call(
             return cur.fetchone()[0]
 
 
+def log_llm_calls(rows: list[dict[str, Any]]) -> None:
+    """Insert several llm_logs rows (log_llm_call kwargs) in one statement."""
+    if not rows:
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                """INSERT INTO llm_logs
+                       (ticket_id, step, model, prompt_template, input_data, output_data,
+                        raw_response, tokens_input, tokens_output, latency_ms)
+                   VALUES %s""",
+                [
+                    (
+                        r["ticket_id"], r["step"], r["model"], r["prompt_template"],
+                        json.dumps(r.get("input_data"), default=str),
+                        json.dumps(r.get("output_data"), default=str),
+                        r.get("raw_response"), r.get("tokens_input", 0),
+                        r.get("tokens_output", 0), r.get("latency_ms", 0),
+                    )
+                    for r in rows
+                ],
+            )
+
+
 # ---------------------------------------------------------------------------
 # Tool call logs
 # ---------------------------------------------------------------------------
@@ -624,6 +686,30 @@ def log_tool_call(
             return cur.fetchone()[0]
 
 
+def log_tool_calls(rows: list[dict[str, Any]]) -> None:
+    """Insert several tool_call_logs rows (log_tool_call kwargs) in one statement."""
+    if not rows:
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                """INSERT INTO tool_call_logs
+                       (ticket_id, store_call_id, tool_name, input_params, output_result,
+                        status, error_message, latency_ms)
+                   VALUES %s""",
+                [
+                    (
+                        r["ticket_id"], r.get("store_call_id"), r["tool_name"],
+                        json.dumps(r.get("input_params"), default=str),
+                        json.dumps(r.get("output_result"), default=str),
+                        r.get("status", "success"), r.get("error_message"), r.get("latency_ms", 0),
+                    )
+                    for r in rows
+                ],
+            )
+
+
 # ---------------------------------------------------------------------------
 # Logistics orders
 # ---------------------------------------------------------------------------
@@ -745,22 +831,20 @@ def update_logistics_order_error(logistics_order_id: int, error_message: str) ->
             )
 
 
-def get_logistics_order(ticket_id: str) -> Optional[dict[str, Any]]:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT id, ticket_id, store_call_id, client_order_id, prorouting_order_id,
-                          quote_id, selected_lsp_id, selected_lsp_name, quoted_price,
-                          pickup_lat, pickup_lng, pickup_address, pickup_pincode, pickup_phone,
-                          drop_lat, drop_lng, drop_address, drop_pincode, drop_phone,
-                          customer_name, order_state, rider_name, rider_phone, tracking_url,
-                          status_callbacks, order_amount, order_weight, error_message,
-                          created_at, updated_at
-                   FROM logistics_orders WHERE ticket_id = %s
-                   ORDER BY created_at DESC LIMIT 1""",
-                (ticket_id,),
-            )
-            row = cur.fetchone()
+def _read_logistics_order(cur, ticket_id: str) -> Optional[dict[str, Any]]:
+    cur.execute(
+        """SELECT id, ticket_id, store_call_id, client_order_id, prorouting_order_id,
+                  quote_id, selected_lsp_id, selected_lsp_name, quoted_price,
+                  pickup_lat, pickup_lng, pickup_address, pickup_pincode, pickup_phone,
+                  drop_lat, drop_lng, drop_address, drop_pincode, drop_phone,
+                  customer_name, order_state, rider_name, rider_phone, tracking_url,
+                  status_callbacks, order_amount, order_weight, error_message,
+                  created_at, updated_at
+           FROM logistics_orders WHERE ticket_id = %s
+           ORDER BY created_at DESC LIMIT 1""",
+        (ticket_id,),
+    )
+    row = cur.fetchone()
     if not row:
         return None
     return {
@@ -784,6 +868,25 @@ def get_logistics_order(ticket_id: str) -> Optional[dict[str, Any]]:
     }
 
 
+def get_logistics_order(ticket_id: str) -> Optional[dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return _read_logistics_order(cur, ticket_id)
+
+
+def get_order_ticket_details(ticket_id: str) -> tuple:
+    """Product, stores, store calls, web deals and logistics order on one connection."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return (
+                _read_product(cur, ticket_id),
+                _read_stores(cur, ticket_id),
+                _read_store_calls(cur, ticket_id),
+                _read_web_deals(cur, ticket_id),
+                _read_logistics_order(cur, ticket_id),
+            )
+
+
 def get_failed_lsp_ids(ticket_id: str) -> list[str]:
     """Get LSP IDs from all cancelled logistics orders for this ticket."""
     with get_connection() as conn:
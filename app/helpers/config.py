@@ -27,7 +27,7 @@ class Config:
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o")
 
-    # Google Maps Places API
+    # Google Maps (Places API (New) for store search, Geocoding API)
     GOOGLE_MAPS_API_KEY: Optional[str] = os.getenv("GOOGLE_MAPS_API_KEY")
 
     # Google Gemini (query intelligence, store enrichment)
@@ -54,6 +54,11 @@ class Config:
     # Limits
     MAX_STORES_TO_CALL: int = int(os.getenv("MAX_STORES_TO_CALL", "5"))
     MAX_ALTERNATIVES: int = int(os.getenv("MAX_ALTERNATIVES", "3"))
+    MAX_CONCURRENT_PIPELINES: int = int(os.getenv("MAX_CONCURRENT_PIPELINES", "32"))
+    MAX_TOOL_CONCURRENCY: int = int(os.getenv("MAX_TOOL_CONCURRENCY", "8"))
+    TOOL_TIMEOUT_SECONDS: float = float(os.getenv("TOOL_TIMEOUT_SECONDS", "15"))
+    RERANK_MIN_STORES: int = int(os.getenv("RERANK_MIN_STORES", "3"))
+    PIPELINE_SHUTDOWN_TIMEOUT_SECONDS: float = float(os.getenv("PIPELINE_SHUTDOWN_TIMEOUT_SECONDS", "30"))
 
     # Store call retry (vendor doesn't pick up)
     STORE_CALL_MAX_RETRIES: int = int(os.getenv("STORE_CALL_MAX_RETRIES", "1"))
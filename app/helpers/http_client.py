@@ -0,0 +1,37 @@
+"""Shared aiohttp session so outbound API calls reuse pooled keep-alive connections."""
+from typing import Optional
+
+import aiohttp
+import orjson
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _json_dumps(obj) -> str:
+    # aiohttp wants str from json_serialize; orjson returns bytes.
+    return orjson.dumps(obj).decode()
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the process-wide ClientSession, creating it on first use (needs a running loop)."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                # Keep one busy API (e.g. a Places fan-out) from starving the others.
+                limit_per_host=50,
+                ttl_dns_cache=300,
+                keepalive_timeout=75,
+            ),
+            json_serialize=_json_dumps,
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared session; called from the app lifespan on shutdown."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
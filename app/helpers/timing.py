@@ -0,0 +1,22 @@
+"""Monotonic latency timing for logged API/LLM calls."""
+import time
+
+
+class timed:
+    """Context manager that records elapsed wall time in whole milliseconds as ``.ms``.
+
+        with timed() as t:
+            await do_request()
+        log(latency_ms=t.ms)
+    """
+
+    __slots__ = ("_start", "ms")
+
+    def __enter__(self) -> "timed":
+        self.ms = 0
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.ms = (time.perf_counter_ns() - self._start) // 1_000_000
+        return False
@@ -3,15 +3,18 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
 
 from app.helpers.config import Config
 from app.helpers.logger import setup_logger
+from app.helpers.http_client import close_session
 from app.db.connection import init_db
 from app.routes import vapi_webhook_routes
 from app.routes import ticket_routes
 from app.routes import logistics_routes
 from app.services.wakeup_scheduler import start_wakeup_scheduler, stop_wakeup_scheduler
+from app.services.log_sink import start_log_sink, stop_log_sink
 
 logger = setup_logger(__name__)
 
@@ -19,9 +22,14 @@ logger = setup_logger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    start_log_sink()
     start_wakeup_scheduler()
     yield
     stop_wakeup_scheduler()
+    await ticket_routes.wait_for_pipelines()
+    await vapi_webhook_routes.drain_background_tasks()
+    await stop_log_sink()
+    await close_session()
 
 
 app = FastAPI(
@@ -29,6 +37,7 @@ app = FastAPI(
     description="Multi-LLM voice service – order anything, schedule wake-up calls, and more",
     version="0.2.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -75,6 +84,8 @@ def main():
         host=Config.SERVER_HOST,
         port=Config.SERVER_PORT,
         reload=True,
+        loop="uvloop",
+        http="httptools",
         log_level=Config.LOG_LEVEL.lower(),
     )
 
@@ -1,7 +1,9 @@
 """Ticket API – the main entry point for the frontend."""
+import asyncio
 from typing import Optional
 
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 from app.helpers.config import Config
@@ -13,26 +15,37 @@ from app.db.tickets import (
     ticket_exists_and_active,
     update_ticket_status,
     update_ticket_query_type,
-    get_store_calls_for_ticket,
-    get_product,
-    get_stores,
+    set_ticket_final_result,
+    set_ticket_vapi_call_id,
+    update_store_priorities,
     get_logistics_order,
-    get_web_deals,
+    get_order_ticket_details,
 )
-import asyncio
-
+from app.helpers.prompt_loader import PromptLoader
 from app.services.orchestrator import classify_query
 from app.services.product_research import research_product
 from app.services.google_maps import find_stores
+from app.services.geocoding import geocode_address
 from app.services.store_caller import call_stores
 from app.services.gemini_client import analyze_query, rerank_stores
 from app.services.web_deals import search_web_deals
 from app.services.options_summary import generate_options_summary
 from app.services.logistics import place_order
+from app.services.vapi_client import create_phone_call
 
 logger = setup_logger(__name__)
 
-router = APIRouter(tags=["tickets"])
+router = APIRouter(tags=["tickets"], default_response_class=ORJSONResponse)
+
+# Pipelines run as in-process tasks; the semaphore caps how many hit the
+# LLM / Maps / VAPI quotas at once. Strong refs keep tasks alive until done.
+_PIPELINE_SEM = asyncio.Semaphore(Config.MAX_CONCURRENT_PIPELINES)
+_pipeline_tasks: set[asyncio.Task] = set()
+# Ticket IDs whose pipeline is running in this process – lets duplicate
+# submits be rejected without a DB round trip.
+_inflight_tickets: set[str] = set()
+
+_TERMINAL_CALL_STATUSES = frozenset({"analyzed", "failed"})
 
 
 class TicketRequest(BaseModel):
@@ -57,7 +70,7 @@ class TicketResponse(BaseModel):
 # ---------------------------------------------------------------------------
 
 @router.post("/api/ticket", response_model=TicketResponse)
-async def create_ticket_endpoint(req: TicketRequest, bg: BackgroundTasks):
+async def create_ticket_endpoint(req: TicketRequest):
     """
     Accept a user query from the frontend, classify it, and kick off the
     appropriate pipeline (wakeup or order) in the background.
@@ -68,7 +81,7 @@ async def create_ticket_endpoint(req: TicketRequest, bg: BackgroundTasks):
         ticket_id = get_next_ticket_id()
         logger.info("Auto-generated ticket_id: %s", ticket_id)
 
-    if ticket_exists_and_active(ticket_id):
+    if ticket_id in _inflight_tickets or ticket_exists_and_active(ticket_id):
         return TicketResponse(
             ticket_id=ticket_id,
             status="rejected",
@@ -76,6 +89,7 @@ async def create_ticket_endpoint(req: TicketRequest, bg: BackgroundTasks):
         )
 
     create_ticket(ticket_id, req.query, req.location, req.user_phone, req.user_name)
+    _inflight_tickets.add(ticket_id)
     logger.info("Ticket %s created: query=%r location=%r", ticket_id, req.query, req.location)
 
     is_test = req.test_mode if req.test_mode is not None else Config.TEST_MODE
@@ -88,11 +102,13 @@ async def create_ticket_endpoint(req: TicketRequest, bg: BackgroundTasks):
     if max_stores is not None:
         max_stores = max(1, min(10, max_stores))
 
-    bg.add_task(
-        _process_ticket, ticket_id, req.query, req.location, req.user_phone,
+    task = asyncio.create_task(_bounded_process(
+        ticket_id, req.query, req.location, req.user_phone,
         test_mode=is_test, test_phone=test_phone, max_stores=max_stores,
         user_name=req.user_name,
-    )
+    ))
+    _pipeline_tasks.add(task)
+    task.add_done_callback(_pipeline_tasks.discard)
 
     return TicketResponse(
         ticket_id=ticket_id,
@@ -107,7 +123,7 @@ async def create_ticket_endpoint(req: TicketRequest, bg: BackgroundTasks):
 
 @router.get("/api/ticket/{ticket_id}")
 async def get_ticket_status(ticket_id: str):
-    ticket = get_ticket(ticket_id)
+    ticket = await asyncio.to_thread(get_ticket, ticket_id)
     if not ticket:
         return {"error": "Ticket not found", "ticket_id": ticket_id}
 
@@ -136,25 +152,25 @@ async def get_ticket_status(ticket_id: str):
 
     # Always include product + store details once available
     if ticket.get("query_type") == "order_product":
-        product = get_product(ticket_id)
+        product, stores, calls, web_deals, logistics = await asyncio.to_thread(
+            get_order_ticket_details, ticket_id,
+        )
         if product:
             response["product"] = product
 
-        stores = get_stores(ticket_id)
         if stores:
             response["stores"] = stores
 
-        calls = get_store_calls_for_ticket(ticket_id)
         if calls:
             response["store_calls"] = calls
+            done = sum(1 for c in calls if c["status"] in _TERMINAL_CALL_STATUSES)
             response["progress"] = {
                 "stores_found": len(stores),
                 "calls_total": len(calls),
-                "calls_completed": sum(1 for c in calls if c["status"] in ("analyzed", "failed")),
-                "calls_in_progress": sum(1 for c in calls if c["status"] not in ("analyzed", "failed")),
+                "calls_completed": done,
+                "calls_in_progress": len(calls) - done,
             }
 
-        web_deals = get_web_deals(ticket_id)
         if web_deals and web_deals.get("deals"):
             response["web_deals"] = {
                 "search_summary": web_deals.get("search_summary"),
@@ -165,7 +181,6 @@ async def get_ticket_status(ticket_id: str):
                 "status": web_deals.get("status"),
             }
 
-        logistics = get_logistics_order(ticket_id)
         if logistics:
             response["delivery"] = {
                 "order_state": logistics.get("order_state"),
@@ -193,8 +208,7 @@ async def get_ticket_options(ticket_id: str):
     result = await generate_options_summary(ticket_id)
     if "error" in result:
         status_code = 404 if result["error"] == "Ticket not found" else 400
-        from fastapi.responses import JSONResponse
-        return JSONResponse(status_code=status_code, content=result)
+        return ORJSONResponse(status_code=status_code, content=result)
     return result
 
 
@@ -216,35 +230,33 @@ async def confirm_ticket_option(ticket_id: str, req: ConfirmRequest):
     selected_option (1-based index into the options list).
     Runs synchronously — returns the actual delivery booking result.
     """
-    from fastapi.responses import JSONResponse
-
     if not req.store_call_id and not req.selected_option:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"error": "Provide either store_call_id or selected_option"},
         )
 
     ticket = get_ticket(ticket_id)
     if not ticket:
-        return JSONResponse(status_code=404, content={"error": "Ticket not found"})
+        return ORJSONResponse(status_code=404, content={"error": "Ticket not found"})
 
     already_ordering = ("placing_order", "order_placed", "agent_assigned", "out_for_delivery")
     if ticket["status"] in already_ordering:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=409,
             content={"error": f"A delivery is already in progress (status: {ticket['status']})", "ticket_id": ticket_id},
         )
 
     allowed = ("completed", "failed", "delivery_failed")
     if ticket["status"] not in allowed:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"error": f"Ticket cannot be confirmed in status '{ticket['status']}'", "ticket_id": ticket_id},
         )
 
     resolved_name = req.customer_name or ticket.get("user_name")
     if not resolved_name:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"error": "customer_name is required (not provided at ticket creation or confirmation)"},
         )
@@ -261,7 +273,7 @@ async def confirm_ticket_option(ticket_id: str, req: ConfirmRequest):
     except Exception as e:
         logger.exception("Delivery order placement failed for ticket %s", ticket_id)
         update_ticket_status(ticket_id, "failed", error_message=f"Delivery booking failed: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"error": f"Delivery booking failed: {e}", "ticket_id": ticket_id},
         )
@@ -269,7 +281,7 @@ async def confirm_ticket_option(ticket_id: str, req: ConfirmRequest):
     logistics = get_logistics_order(ticket_id)
     if not logistics or logistics.get("order_state") == "failed":
         error_msg = (logistics or {}).get("error_message", "Unknown error during delivery booking")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"error": error_msg, "ticket_id": ticket_id},
         )
@@ -299,13 +311,11 @@ async def get_delivery_status(ticket_id: str):
     """Get the logistics/delivery details for a ticket."""
     ticket = get_ticket(ticket_id)
     if not ticket:
-        from fastapi.responses import JSONResponse
-        return JSONResponse(status_code=404, content={"error": "Ticket not found"})
+        return ORJSONResponse(status_code=404, content={"error": "Ticket not found"})
 
     logistics = get_logistics_order(ticket_id)
     if not logistics:
-        from fastapi.responses import JSONResponse
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=404,
             content={"error": "No delivery order found for this ticket", "ticket_id": ticket_id},
         )
@@ -350,6 +360,34 @@ async def get_delivery_status(ticket_id: str):
 # Background pipeline
 # ---------------------------------------------------------------------------
 
+async def _bounded_process(ticket_id: str, *args, **kwargs) -> None:
+    """Run _process_ticket once a pipeline slot is free."""
+    try:
+        async with _PIPELINE_SEM:
+            await _process_ticket(ticket_id, *args, **kwargs)
+    finally:
+        _inflight_tickets.discard(ticket_id)
+
+
+async def wait_for_pipelines() -> None:
+    """Wait for in-flight ticket pipelines to finish (called on shutdown).
+
+    Pipelines still running after PIPELINE_SHUTDOWN_TIMEOUT_SECONDS are cancelled.
+    """
+    if not _pipeline_tasks:
+        return
+    logger.info("Waiting for %d in-flight ticket pipelines", len(_pipeline_tasks))
+    _, pending = await asyncio.wait(set(_pipeline_tasks), timeout=Config.PIPELINE_SHUTDOWN_TIMEOUT_SECONDS)
+    if pending:
+        logger.warning(
+            "Abandoning %d ticket pipeline(s) still running after %ss",
+            len(pending), Config.PIPELINE_SHUTDOWN_TIMEOUT_SECONDS,
+        )
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
 async def _process_ticket(
     ticket_id: str, query: str, location: str, user_phone: str,
     *, test_mode: bool = False, test_phone: Optional[str] = None,
@@ -378,10 +416,6 @@ async def _process_ticket(
 
 async def _handle_wakeup(ticket_id: str, query: str, user_phone: str) -> None:
     """Handle wake-up/alarm/reminder flow using existing VAPI infrastructure."""
-    from app.services.vapi_client import create_phone_call
-    from app.helpers.prompt_loader import PromptLoader
-    from app.db.tickets import set_ticket_vapi_call_id
-
     update_ticket_status(ticket_id, "wakeup_calling")
 
     loader = PromptLoader()
@@ -406,6 +440,10 @@ async def _handle_order(
 ) -> None:
     """Handle order/product flow: analyze → research → [web search + find stores + call] in parallel."""
 
+    # Store discovery only needs the user's coordinates, so geocode now and
+    # let it overlap with analysis + research instead of delaying find_stores.
+    user_geo_task = asyncio.create_task(geocode_address(location))
+
     # Step 2a: Gemini query intelligence
     query_analysis = None
     try:
@@ -450,6 +488,12 @@ async def _handle_order(
     if query_analysis and query_analysis.get("is_specific_store"):
         specific_store_name = query_analysis.get("specific_store_name")
 
+    user_geo = None
+    try:
+        user_geo = await user_geo_task
+    except Exception as e:
+        logger.warning("Geocoding user location failed for ticket %s: %s", ticket_id, e)
+
     stores = await find_stores(
         ticket_id,
         product.get("store_search_query", "store"),
@@ -457,6 +501,8 @@ async def _handle_order(
         max_stores=max_stores,
         search_queries=search_queries,
         specific_store_name=specific_store_name,
+        user_lat=user_geo.get("lat") if user_geo else None,
+        user_lng=user_geo.get("lng") if user_geo else None,
     )
     logger.info("Ticket %s: found %d callable stores", ticket_id, len(stores))
 
@@ -466,7 +512,6 @@ async def _handle_order(
             reranked = await rerank_stores(ticket_id, query, stores, query_analysis)
             ordered_place_ids = [s.get("place_id") for s in reranked if s.get("place_id")]
             if ordered_place_ids:
-                from app.db.tickets import update_store_priorities
                 update_store_priorities(ticket_id, ordered_place_ids)
             logger.info("Ticket %s: stores re-ranked by Gemini", ticket_id)
         except Exception as e:
@@ -475,7 +520,6 @@ async def _handle_order(
     if not stores:
         # Even with no stores, wait for web deals — they might still help
         web_deals = await web_deals_task
-        from app.db.tickets import set_ticket_final_result
         result = {
             "status": "no_stores",
             "message": "Could not find any stores with phone numbers near the given location.",
@@ -506,16 +550,14 @@ async def _handle_order(
         update_ticket_status(ticket_id, "calling_stores")
         call_results = await call_stores(ticket_id, product, location, max_stores=max_stores, customer_name=user_name)
 
+    active_calls = sum(1 for r in call_results if r["status"] == "calling")
     logger.info(
         "Ticket %s: initiated %d store calls (%d successful)",
-        ticket_id, len(call_results),
-        sum(1 for r in call_results if r["status"] == "calling"),
+        ticket_id, len(call_results), active_calls,
     )
 
-    active_calls = [r for r in call_results if r["status"] == "calling"]
     if not active_calls:
         web_deals = await web_deals_task
-        from app.db.tickets import set_ticket_final_result
         result = {
             "status": "call_failed",
             "message": "All store calls failed to initiate.",
@@ -537,3 +579,9 @@ async def _search_web_deals_safe(
     except Exception as e:
         logger.warning("Web deals search failed for ticket %s: %s", ticket_id, e)
         return {"deals": [], "error": str(e)}
+
+
+# Each (path, method) pair must be registered exactly once on this router.
+_route_keys = [(r.path, m) for r in router.routes for m in sorted(r.methods)]
+assert len(set(_route_keys)) == len(_route_keys), "duplicate ticket routes registered"
+del _route_keys
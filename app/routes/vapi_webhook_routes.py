@@ -1,83 +1,131 @@
 """VAPI webhooks: wakeup calls (/api/vapi/webhook) and store calls (/api/vapi/store-webhook)."""
 import asyncio
-import json
-from typing import Optional
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Optional
 
+import orjson
 from fastapi import APIRouter, Request, Response
+from fastapi.responses import ORJSONResponse
 
 from app.helpers.config import Config
 from app.helpers.logger import setup_logger
 from app.helpers.prompt_loader import PromptLoader
-from app.schemas.tool_handlers import execute_tool, STORE_TOOL_HANDLERS
-from app.services.vapi_client import get_wakeup_assistant_for_webhook
+from app.db.tickets import (
+    get_ticket,
+    get_ticket_by_vapi_call_id,
+    append_ticket_tool_calls,
+    save_ticket_transcript,
+    get_product,
+    get_store_by_id,
+    get_store_call_by_vapi_id,
+    get_store_call_retry_count,
+    save_store_call_transcript,
+    save_store_call_tool_calls,
+    save_store_call_analysis,
+    update_store_call_status,
+    reset_store_call_for_retry,
+    count_pending_calls,
+    log_tool_call,
+)
+from app.schemas.tool_handlers import execute_tool, flush_store_tool_logs, STORE_TOOL_HANDLERS, _ASYNC_HANDLERS
+from app.services.store_caller import _build_store_prompt
+from app.services.transcript_analyzer import analyze_transcript, _compile_final_result
+from app.services.vapi_client import get_wakeup_assistant_for_webhook, create_store_phone_call
 
 logger = setup_logger(__name__)
 
-router = APIRouter(tags=["vapi-webhook"])
+router = APIRouter(tags=["vapi-webhook"], default_response_class=ORJSONResponse)
 
 
 # ---------------------------------------------------------------------------
 # Helpers shared by both webhooks
 # ---------------------------------------------------------------------------
 
-def _customer_number_from_message(body: dict) -> Optional[str]:
-    msg = body.get("message") or {}
-    call = msg.get("call") or body.get("call") or {}
-    customer = call.get("customer") or msg.get("customer") or body.get("customer") or {}
-    num = customer.get("number") if isinstance(customer, dict) else None
-    num = num or call.get("customerNumber") or getattr(customer, "number", None)
-    return num if isinstance(num, str) and num.strip() else None
+# Stateless replies are shared across requests instead of rebuilt each time.
+_EMPTY_OK = Response(status_code=200, content=b"{}", media_type="application/json")
+_BAD_JSON = Response(status_code=400, content=b"Invalid JSON")
 
 
-def _vapi_call_id_from_message(body: dict) -> Optional[str]:
-    msg = body.get("message") or {}
-    call = msg.get("call") or body.get("call") or {}
-    return call.get("id")
+# Webhook bodies above this fall back to Starlette's own reader rather than
+# trusting a client-supplied Content-Length for a single allocation.
+_MAX_PREALLOC_BODY = 1 << 20
 
 
-def _looks_like_phone(s: str) -> bool:
-    if not s or not isinstance(s, str):
-        return False
-    s = s.strip()
-    if s in ("default_user", "default", ""):
-        return False
-    return s.startswith("+") or (s.isdigit() and len(s) >= 10)
+async def _read_body(request: Request) -> bytes | bytearray:
+    """Read the request body into one buffer sized from Content-Length (orjson parses either type)."""
+    cl = request.headers.get("content-length")
+    if not cl or not cl.isdigit() or int(cl) > _MAX_PREALLOC_BODY:
+        return await request.body()
+    buf = bytearray(int(cl))
+    mv = memoryview(buf)
+    pos = 0
+    async for chunk in request.stream():
+        mv[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+    mv.release()
+    return buf if pos == len(buf) else buf[:pos]
 
 
-def _tool_name(it: dict) -> str:
-    tc = it.get("toolCall") or {}
-    fn = it.get("function") or tc.get("function") or {}
-    name = it.get("name") or tc.get("name")
-    if not name and isinstance(fn, dict):
-        name = fn.get("name")
-    return name or "(unknown)"
+def _as_dict(x) -> dict:
+    """Return x if it is a dict, else an empty dict (exact-type check first)."""
+    return x if type(x) is dict or isinstance(x, dict) else {}
 
 
-def _tool_call_id(it: dict) -> Optional[str]:
-    tc = it.get("toolCall") or {}
-    return tc.get("id") or it.get("id")
+def _envelope(body: dict) -> tuple[dict, dict]:
+    """Resolve the (message, call) sub-dicts of a webhook body once per request."""
+    msg = _as_dict(body.get("message"))
+    call = _as_dict(msg.get("call") or body.get("call"))
+    return msg, call
 
 
-def _tool_params(it: dict) -> dict:
-    tc = it.get("toolCall") or {}
-    fn = it.get("function") or tc.get("function") or {}
-    raw = (
-        it.get("parameters") or it.get("arguments")
-        or tc.get("parameters") or tc.get("arguments")
-        or (fn.get("parameters") if isinstance(fn, dict) else None)
-        or (fn.get("arguments") if isinstance(fn, dict) else None)
-        or {}
-    )
+def _customer_number_from_message(body: dict, msg: dict, call: dict) -> Optional[str]:
+    customer = _as_dict(call.get("customer") or msg.get("customer") or body.get("customer"))
+    num = customer.get("number") or call.get("customerNumber")
+    return num if isinstance(num, str) and num.strip() else None
+
+
+# "+..." (E.164-ish) or at least ten digits. Placeholder IDs like
+# "default_user" never match, so they need no separate check.
+_PHONE_RE = re.compile(r"\+|\d{10,}\Z")
+
+
+def _looks_like_phone(s: str) -> bool:
+    return isinstance(s, str) and _PHONE_RE.match(s.strip()) is not None
+
+
+def _parse_tool_item(it: dict) -> tuple[str, Optional[str], dict]:
+    """Return (name, toolCallId, params) for one tool-call item, resolving toolCall/function once."""
+    tc = _as_dict(it.get("toolCall"))
+    fn = _as_dict(it.get("function") or tc.get("function"))
+    name = it.get("name") or tc.get("name") or fn.get("name") or "(unknown)"
+    tcid = tc.get("id") or it.get("id")
+    if name == "(unknown)":
+        return name, tcid, {}
+    return name, tcid, _tool_params(it, tc, fn)
+
+
+def _tool_params(it: dict, tc: dict, fn: dict) -> dict:
+    # First non-empty parameters/arguments, searched item → toolCall → function
+    for src in (it, tc, fn):
+        raw = src.get("parameters") or src.get("arguments")
+        if raw:
+            break
+    else:
+        return {}
     if isinstance(raw, str):
+        # No-argument tools are the common case; skip the parser for them.
+        if raw == "{}":
+            return {}
         try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
+            raw = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             return {}
-    return raw if isinstance(raw, dict) else {}
+    return _as_dict(raw)
 
 
-def _extract_tool_call_list(body: dict) -> list:
-    msg = body.get("message") or {}
+def _extract_tool_call_list(body: dict, msg: dict) -> list:
     tcl = (
         msg.get("toolCallList") or msg.get("toolWithToolCallList")
         or body.get("toolCallList") or body.get("toolWithToolCallList") or []
@@ -85,48 +133,144 @@ def _extract_tool_call_list(body: dict) -> list:
     return tcl if isinstance(tcl, list) else []
 
 
-def _handle_live_transcript(body: dict, call_label: str, vapi_call_id: Optional[str]) -> bool:
+@lru_cache(maxsize=1)
+def _default_prompt() -> str:
+    return PromptLoader().get_default_prompt()
+
+
+@lru_cache(maxsize=8)
+def _assistant_response_body(server_url: str) -> bytes:
+    """Serialized assistant-request reply; it only varies with server_url."""
+    assistant = get_wakeup_assistant_for_webhook(server_url, _default_prompt())
+    return orjson.dumps({"assistant": assistant})
+
+
+# Caps tool fan-out across all webhooks so a large batch can't flood the DB
+# or downstream APIs; the timeout (which includes the wait for the semaphore)
+# keeps slow or queued tools from holding the reply past VAPI's own deadline.
+_TOOL_SEM = asyncio.Semaphore(Config.MAX_TOOL_CONCURRENCY or 8)
+
+# A sync handler runs in a worker thread that a timeout can't stop, so its
+# write still lands; tell the model not to retry rather than report a failure.
+_TOOL_STILL_RUNNING = {
+    "status": "processing",
+    "message": "Still processing; this will complete shortly. Do not call this tool again.",
+}
+
+
+async def _bounded_tool(name: str, coro) -> dict:
+    started = False
+
+    async def run() -> dict:
+        nonlocal started
+        async with _TOOL_SEM:
+            started = True
+            return await coro
+
+    task = asyncio.ensure_future(run())
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=Config.TOOL_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        if started and name not in _ASYNC_HANDLERS:
+            # Keep the task (and its semaphore slot) until the thread finishes.
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            logger.warning("Tool %s still running after %ss", name, Config.TOOL_TIMEOUT_SECONDS)
+            return dict(_TOOL_STILL_RUNNING)
+        task.cancel()
+        if not started:
+            coro.close()
+        return {"error": "Tool timed out"}
+
+
+# Fire-and-forget work (transcript saves, tool-call logging, retries) is held
+# here until it finishes; the event loop itself only keeps weak references.
+_background_tasks: set[asyncio.Task] = set()
+BACKGROUND_DRAIN_TIMEOUT_SEC = 10
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def drain_background_tasks() -> None:
+    """Let queued webhook work finish on shutdown; cancel what's still running after the timeout."""
+    if not _background_tasks:
+        return
+    logger.info("Waiting for %d webhook background task(s)", len(_background_tasks))
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=BACKGROUND_DRAIN_TIMEOUT_SEC)
+    if pending:
+        logger.warning("Cancelling %d webhook background task(s) after %ss", len(pending), BACKGROUND_DRAIN_TIMEOUT_SEC)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _result_text(result: dict) -> str:
+    """VAPI types each tool result as a string, so the result dict is embedded as JSON text."""
+    return orjson.dumps(result).decode()
+
+
+async def _gather_tools(calls: list[tuple[str, Any]]) -> list[dict]:
+    """Run (tool name, coroutine) pairs concurrently, keeping order and turning exceptions into error results."""
+    outcomes = await asyncio.gather(*(_bounded_tool(name, c) for name, c in calls), return_exceptions=True)
+    return [
+        {"error": str(o)} if isinstance(o, BaseException) else o
+        for o in outcomes
+    ]
+
+
+def _live_transcript(msg: dict, tag: str) -> None:
+    role = msg.get("role") or "?"
+    text = msg.get("transcript") or ""
+    if (msg.get("transcriptType") or "partial") == "final":
+        logger.info("%s 🎙  %s: %s", tag, role.upper(), text)
+    elif logger.isEnabledFor(logging.DEBUG):
+        # Partials arrive many times per utterance; skip the work unless debugging.
+        logger.debug("%s 🎙  %s (partial): %s", tag, role.upper(), text)
+
+
+def _live_conversation_update(msg: dict, tag: str) -> None:
+    conversation = msg.get("conversation") or []
+    if conversation and logger.isEnabledFor(logging.INFO):
+        last = conversation[-1]
+        role = last.get("role") or "?"
+        content = last.get("content") or ""
+        logger.info("%s 💬 conversation [%d msgs] latest %s: %s",
+                    tag, len(conversation), role.upper(), content[:300])
+
+
+def _live_status_update(msg: dict, tag: str) -> None:
+    logger.info("%s 📞 status -> %s", tag, msg.get("status") or "(unknown)")
+
+
+def _live_speech_update(msg: dict, tag: str) -> None:
+    logger.info("%s 🔊 %s speech %s", tag, msg.get("role") or "?", msg.get("status") or "(unknown)")
+
+
+_LIVE_HANDLERS = {
+    "transcript": _live_transcript,
+    "conversation-update": _live_conversation_update,
+    "status-update": _live_status_update,
+    "speech-update": _live_speech_update,
+}
+
+
+def _handle_live_transcript(msg: dict, call_label: str, vapi_call_id: Optional[str]) -> bool:
     """
     Handle real-time VAPI events (transcript, conversation-update, status-update,
     speech-update). Returns True if the event was handled and the caller should
     return early.
     """
-    msg = body.get("message") or {}
-    msg_type = msg.get("type") or ""
-    tag = f"[{call_label}:{vapi_call_id or '?'}]"
-
-    if msg_type == "transcript":
-        role = msg.get("role") or "?"
-        text = msg.get("transcript") or ""
-        ttype = msg.get("transcriptType") or "partial"
-        if ttype == "final":
-            logger.info("%s 🎙  %s: %s", tag, role.upper(), text)
-        else:
-            logger.debug("%s 🎙  %s (partial): %s", tag, role.upper(), text)
-        return True
-
-    if msg_type == "conversation-update":
-        conversation = msg.get("conversation") or []
-        if conversation:
-            last = conversation[-1]
-            role = last.get("role") or "?"
-            content = last.get("content") or ""
-            logger.info("%s 💬 conversation [%d msgs] latest %s: %s",
-                        tag, len(conversation), role.upper(), content[:300])
-        return True
-
-    if msg_type == "status-update":
-        status = msg.get("status") or "(unknown)"
-        logger.info("%s 📞 status -> %s", tag, status)
-        return True
-
-    if msg_type == "speech-update":
-        status = msg.get("status") or "(unknown)"
-        role = msg.get("role") or "?"
-        logger.info("%s 🔊 %s speech %s", tag, role, status)
-        return True
-
-    return False
+    msg_type = msg.get("type")
+    handler = _LIVE_HANDLERS.get(msg_type) if isinstance(msg_type, str) else None
+    if handler is None:
+        return False
+    handler(msg, f"[{call_label}:{vapi_call_id or '?'}]")
+    return True
 
 
 # ---------------------------------------------------------------------------
@@ -136,96 +280,126 @@ def _handle_live_transcript(body: dict, call_label: str, vapi_call_id: Optional[
 @router.post("/api/vapi/webhook")
 async def vapi_webhook(request: Request) -> Response:
     try:
-        body = await request.json()
+        body = orjson.loads(await _read_body(request))
     except Exception as e:
         logger.warning("VAPI webhook invalid JSON: %s", e)
-        return Response(status_code=400, content=b"Invalid JSON")
+        return _BAD_JSON
 
-    msg = body.get("message") or {}
-    msg_type = msg.get("type") or "(unknown)"
-    vapi_call_id = _vapi_call_id_from_message(body)
+    msg, call = _envelope(body)
 
     # ---- live transcript / status / speech events ----
-    if _handle_live_transcript(body, "wakeup", vapi_call_id):
-        return Response(status_code=200, content=b"{}")
-
-    # ---- end-of-call-report: save transcript + finalize ticket ----
-    if msg_type == "end-of-call-report":
-        ended_reason = msg.get("endedReason") or body.get("endedReason") or "(none)"
-        transcript = (msg.get("transcript") or msg.get("artifact", {}).get("transcript") or "").strip()
-        logger.info("VAPI wakeup call ended: vapi_call_id=%s reason=%s", vapi_call_id, ended_reason)
-        if transcript:
-            logger.info("Transcript: %s", transcript[:2000])
-
-        if vapi_call_id:
-            try:
-                from app.db.tickets import get_ticket_by_vapi_call_id, save_ticket_transcript
-                ticket = get_ticket_by_vapi_call_id(vapi_call_id)
-                if ticket:
-                    save_ticket_transcript(ticket["ticket_id"], transcript, ended_reason)
-                    logger.info("Wakeup transcript saved for ticket %s", ticket["ticket_id"])
-            except Exception:
-                logger.exception("Failed to save wakeup transcript for vapi_call_id=%s", vapi_call_id)
-
-        return Response(status_code=200, content=b"{}")
-
-    # ---- assistant-request ----
-    if msg_type == "assistant-request":
-        server_url = Config.VAPI_SERVER_URL or str(request.base_url).rstrip("/")
-        prompt_loader = PromptLoader()
-        system_prompt = prompt_loader.get_default_prompt()
-        assistant = get_wakeup_assistant_for_webhook(server_url, system_prompt)
-        return Response(content=json.dumps({"assistant": assistant}), media_type="application/json")
-
-    # ---- tool-calls: execute + log to ticket ----
-    if msg_type == "tool-calls":
-        customer_number = _customer_number_from_message(body)
-        tool_call_list = _extract_tool_call_list(body)
-
-        logger.info("VAPI wakeup tool-calls: %d items, vapi_call_id=%s", len(tool_call_list), vapi_call_id)
-        results = []
-        for item in tool_call_list:
-            name = _tool_name(item)
-            tcid = _tool_call_id(item)
-            params = _tool_params(item)
-
-            if not name or name == "(unknown)":
-                continue
-
-            if customer_number and "user_id" not in params:
-                params["user_id"] = customer_number
-
-            if name == "schedule_wakeup_call":
-                user_id = params.get("user_id") or customer_number
-                if not _looks_like_phone(str(user_id or "")):
-                    result = {"success": False, "error": "No valid phone number for callback."}
-                else:
-                    result = await execute_tool(name, json.dumps(params))
-            else:
-                result = await execute_tool(name, json.dumps(params))
+    if _handle_live_transcript(msg, "wakeup", call.get("id")):
+        return _EMPTY_OK
+
+    msg_type = msg.get("type")
+    handler = _WAKEUP_HANDLERS.get(msg_type) if isinstance(msg_type, str) else None
+    return await handler(request, body, msg, call) if handler else _EMPTY_OK
+
+
+async def _h_wakeup_end_of_call(request: Request, body: dict, msg: dict, call: dict) -> Response:
+    """end-of-call-report: save transcript + finalize ticket."""
+    vapi_call_id = call.get("id")
+    ended_reason = msg.get("endedReason") or body.get("endedReason") or "(none)"
+    transcript = (msg.get("transcript") or msg.get("artifact", {}).get("transcript") or "").strip()
+    logger.info("VAPI wakeup call ended: vapi_call_id=%s reason=%s", vapi_call_id, ended_reason)
+    if transcript and logger.isEnabledFor(logging.INFO):
+        logger.info("Transcript: %s", transcript[:2000])
+
+    if vapi_call_id:
+        _spawn(_handle_wakeup_transcript(vapi_call_id, transcript, ended_reason))
+
+    return _EMPTY_OK
+
+
+async def _h_wakeup_assistant_request(request: Request, body: dict, msg: dict, call: dict) -> Response:
+    """assistant-request: return the wakeup assistant config."""
+    server_url = Config.VAPI_SERVER_URL or str(request.base_url).rstrip("/")
+    return Response(content=_assistant_response_body(server_url), media_type="application/json")
+
+
+async def _h_wakeup_tool_calls(request: Request, body: dict, msg: dict, call: dict) -> Response:
+    """tool-calls: execute + log to ticket."""
+    vapi_call_id = call.get("id")
+    customer_number = _customer_number_from_message(body, msg, call)
+    tool_call_list = _extract_tool_call_list(body, msg)
+
+    logger.info("VAPI wakeup tool-calls: %d items, vapi_call_id=%s", len(tool_call_list), vapi_call_id)
+    prepared = []
+    for item in tool_call_list:
+        name, tcid, params = _parse_tool_item(item)
+        if name == "(unknown)":
+            continue
+
+        if customer_number and "user_id" not in params:
+            params["user_id"] = customer_number
+        prepared.append((name, tcid, params))
+
+    # Look the ticket up while the tools run; it's only needed for bookkeeping.
+    ticket_lookup = None
+    if vapi_call_id and prepared:
+        ticket_lookup = asyncio.create_task(asyncio.to_thread(get_ticket_by_vapi_call_id, vapi_call_id))
 
+    tool_results = await _gather_tools([
+        (name, _run_wakeup_tool(name, params, customer_number)) for name, _, params in prepared
+    ])
+
+    log_tools = logger.isEnabledFor(logging.INFO)
+    results = []
+    for (name, tcid, params), result in zip(prepared, tool_results):
+        if log_tools:
             logger.info("Tool %s -> %s", name, result.get("message") or result.get("error") or "ok")
-            results.append({
-                "name": name,
-                "toolCallId": tcid,
-                "result": json.dumps(result) if not isinstance(result, str) else result,
-            })
+        results.append({
+            "name": name,
+            "toolCallId": tcid,
+            "result": _result_text(result),
+        })
+
+    # Log tool calls to the ticket without holding up the VAPI response
+    if ticket_lookup:
+        _spawn(_log_wakeup_tool_calls(ticket_lookup, [
+            {"tool": name, "params": params, "result": result}
+            for (name, _, params), result in zip(prepared, tool_results)
+        ]))
+
+    return ORJSONResponse({"results": results})
+
+
+_WAKEUP_HANDLERS = {
+    "end-of-call-report": _h_wakeup_end_of_call,
+    "assistant-request": _h_wakeup_assistant_request,
+    "tool-calls": _h_wakeup_tool_calls,
+}
 
-            # Log tool call to ticket if we can find it
-            if vapi_call_id:
-                try:
-                    from app.db.tickets import get_ticket_by_vapi_call_id, append_ticket_tool_call
-                    ticket = get_ticket_by_vapi_call_id(vapi_call_id)
-                    if ticket:
-                        append_ticket_tool_call(ticket["ticket_id"], {
-                            "tool": name, "params": params, "result": result,
-                        })
-                except Exception:
-                    logger.exception("Failed to log wakeup tool call to ticket")
 
-        return Response(content=json.dumps({"results": results}), media_type="application/json")
+async def _handle_wakeup_transcript(vapi_call_id: str, transcript: str, ended_reason: str) -> None:
+    """Background task: save the wakeup call transcript on its ticket."""
+    try:
+        ticket = await asyncio.to_thread(get_ticket_by_vapi_call_id, vapi_call_id)
+        if ticket:
+            await asyncio.to_thread(save_ticket_transcript, ticket["ticket_id"], transcript, ended_reason)
+            logger.info("Wakeup transcript saved for ticket %s", ticket["ticket_id"])
+    except Exception:
+        logger.exception("Failed to save wakeup transcript for vapi_call_id=%s", vapi_call_id)
+
 
-    return Response(status_code=200, content=b"{}")
+async def _run_wakeup_tool(name: str, params: dict, customer_number: Optional[str]) -> dict:
+    """Execute one wakeup tool, refusing to schedule a callback without a real phone number."""
+    if name == "schedule_wakeup_call":
+        user_id = params.get("user_id") or customer_number
+        if not _looks_like_phone(str(user_id or "")):
+            return {"success": False, "error": "No valid phone number for callback."}
+    return await execute_tool(name, params)
+
+
+async def _log_wakeup_tool_calls(ticket_lookup: asyncio.Task, tool_calls: list[dict]) -> None:
+    """Background task: append a webhook's tool calls to the wakeup ticket in one write."""
+    try:
+        ticket = await ticket_lookup
+        if not ticket:
+            return
+        await asyncio.to_thread(append_ticket_tool_calls, ticket["ticket_id"], tool_calls)
+    except Exception:
+        logger.exception("Failed to log wakeup tool call to ticket")
 
 
 # ---------------------------------------------------------------------------
@@ -236,75 +410,121 @@ async def vapi_webhook(request: Request) -> Response:
 async def vapi_store_webhook(request: Request) -> Response:
     """Handle VAPI webhooks for store inquiry calls."""
     try:
-        body = await request.json()
+        body = orjson.loads(await _read_body(request))
     except Exception as e:
         logger.warning("Store webhook invalid JSON: %s", e)
-        return Response(status_code=400, content=b"Invalid JSON")
+        return _BAD_JSON
 
-    msg = body.get("message") or {}
-    msg_type = msg.get("type") or "(unknown)"
-    vapi_call_id = _vapi_call_id_from_message(body)
+    msg, call = _envelope(body)
 
     # ---- live transcript / status / speech events ----
-    if _handle_live_transcript(body, "store", vapi_call_id):
-        return Response(status_code=200, content=b"{}")
-
-    # ---- end-of-call-report: trigger transcript analysis ----
-    if msg_type == "end-of-call-report":
-        artifact = msg.get("artifact") or {}
-        transcript = (msg.get("transcript") or artifact.get("transcript") or "").strip()
-        transcript_messages = artifact.get("messages") or []
-        ended_reason = msg.get("endedReason") or body.get("endedReason") or "(none)"
-        logger.info("Store call ended: vapi_call_id=%s reason=%s transcript_len=%d messages=%d",
-                     vapi_call_id, ended_reason, len(transcript), len(transcript_messages))
-
-        if vapi_call_id:
-            if transcript or transcript_messages:
-                asyncio.create_task(_handle_store_transcript(
-                    vapi_call_id, transcript, ended_reason, transcript_messages,
-                ))
-            else:
-                asyncio.create_task(_handle_store_no_transcript(vapi_call_id, ended_reason))
+    if _handle_live_transcript(msg, "store", call.get("id")):
+        return _EMPTY_OK
+
+    msg_type = msg.get("type")
+    handler = _STORE_HANDLERS.get(msg_type) if isinstance(msg_type, str) else None
+    return await handler(request, body, msg, call) if handler else _EMPTY_OK
+
+
+async def _h_store_end_of_call(request: Request, body: dict, msg: dict, call: dict) -> Response:
+    """end-of-call-report: trigger transcript analysis."""
+    vapi_call_id = call.get("id")
+    artifact = msg.get("artifact") or {}
+    transcript = (msg.get("transcript") or artifact.get("transcript") or "").strip()
+    transcript_messages = artifact.get("messages") or []
+    ended_reason = msg.get("endedReason") or body.get("endedReason") or "(none)"
+    logger.info("Store call ended: vapi_call_id=%s reason=%s transcript_len=%d messages=%d",
+                vapi_call_id, ended_reason, len(transcript), len(transcript_messages))
+
+    if vapi_call_id:
+        # Pick up tool logs queued after the last tool-calls webhook flushed
+        _spawn(_flush_store_call_logs(vapi_call_id))
+        if transcript or transcript_messages:
+            _spawn(_handle_store_transcript(
+                vapi_call_id, transcript, ended_reason, transcript_messages,
+            ))
+        else:
+            _spawn(_handle_store_no_transcript(vapi_call_id, ended_reason))
+
+    return _EMPTY_OK
+
+
+async def _h_store_tool_calls(request: Request, body: dict, msg: dict, call: dict) -> Response:
+    """tool-calls: execute store tools."""
+    vapi_call_id = call.get("id")
+    tool_call_list = _extract_tool_call_list(body, msg)
+    logger.info("Store tool-calls: %d items, vapi_call_id=%s", len(tool_call_list), vapi_call_id)
+
+    prepared = []
+    for item in tool_call_list:
+        name, tcid, params = _parse_tool_item(item)
+        if name not in STORE_TOOL_HANDLERS:
+            continue
+        prepared.append((name, tcid, params))
+
+    extra = {"_vapi_call_id": vapi_call_id} if vapi_call_id else {}
+    tool_results = await _gather_tools([
+        (name, execute_tool(name, params, extra_context=extra)) for name, _, params in prepared
+    ])
+
+    # Accumulate tool calls for later analysis
+    accumulated: list[dict] = []
+    results = []
+    for (name, tcid, params), result in zip(prepared, tool_results):
+        accumulated.append({"tool": name, "params": params, "result": result})
+        results.append({
+            "name": name,
+            "toolCallId": tcid,
+            "result": _result_text(result),
+        })
+
+    # Persist raw tool calls on the store_call record without holding up the VAPI response
+    if vapi_call_id and accumulated:
+        task = _spawn(_save_store_tool_calls(
+            vapi_call_id, accumulated, _store_tool_saves.get(vapi_call_id),
+        ))
+        _store_tool_saves[vapi_call_id] = task
+        task.add_done_callback(
+            lambda t: _store_tool_saves.pop(vapi_call_id, None) if _store_tool_saves.get(vapi_call_id) is t else None
+        )
+
+    return ORJSONResponse({"results": results})
 
-        return Response(status_code=200, content=b"{}")
 
-    # ---- tool-calls: execute store tools ----
-    if msg_type == "tool-calls":
-        tool_call_list = _extract_tool_call_list(body)
-        logger.info("Store tool-calls: %d items, vapi_call_id=%s", len(tool_call_list), vapi_call_id)
+_STORE_HANDLERS = {
+    "end-of-call-report": _h_store_end_of_call,
+    "tool-calls": _h_store_tool_calls,
+}
 
-        # Accumulate tool calls for later analysis
-        accumulated: list[dict] = []
-        results = []
-        for item in tool_call_list:
-            name = _tool_name(item)
-            tcid = _tool_call_id(item)
-            params = _tool_params(item)
 
-            if not name or name == "(unknown)" or name not in STORE_TOOL_HANDLERS:
-                continue
+# Latest tool-call save per vapi_call_id. tool_calls_raw is overwritten on each
+# save, so saves for one call are chained in webhook order and the end-of-call
+# handlers wait for the last one before reading it back.
+_store_tool_saves: dict[str, asyncio.Task] = {}
 
-            extra = {"_vapi_call_id": vapi_call_id} if vapi_call_id else {}
-            result = await execute_tool(name, json.dumps(params), extra_context=extra)
 
-            accumulated.append({"tool": name, "params": params, "result": result})
-            results.append({
-                "name": name,
-                "toolCallId": tcid,
-                "result": json.dumps(result) if not isinstance(result, str) else result,
-            })
+async def _wait_store_tool_saves(vapi_call_id: str) -> None:
+    task = _store_tool_saves.get(vapi_call_id)
+    if task:
+        await asyncio.wait([task])
 
-        # Persist raw tool calls on the store_call record
-        if vapi_call_id and accumulated:
-            try:
-                from app.db.tickets import save_store_call_tool_calls
-                save_store_call_tool_calls(vapi_call_id, accumulated)
-            except Exception:
-                logger.exception("Failed to persist store tool calls")
 
-        return Response(content=json.dumps({"results": results}), media_type="application/json")
+async def _save_store_tool_calls(
+    vapi_call_id: str, tool_calls: list[dict], previous: Optional[asyncio.Task] = None,
+) -> None:
+    """Background task: store a webhook's raw tool calls and flush its queued tool logs."""
+    if previous:
+        await asyncio.wait([previous])
+    try:
+        await asyncio.to_thread(save_store_call_tool_calls, vapi_call_id, tool_calls)
+    except Exception:
+        logger.exception("Failed to persist store tool calls")
+    await asyncio.to_thread(flush_store_tool_logs, vapi_call_id)
+
 
-    return Response(status_code=200, content=b"{}")
+async def _flush_store_call_logs(vapi_call_id: str) -> None:
+    await _wait_store_tool_saves(vapi_call_id)
+    await asyncio.to_thread(flush_store_tool_logs, vapi_call_id)
 
 
 async def _handle_store_transcript(
@@ -315,33 +535,20 @@ async def _handle_store_transcript(
 ) -> None:
     """Background task: save transcript and run the transcript analyzer LLM."""
     try:
-        from app.db.tickets import save_store_call_transcript, get_store_call_by_vapi_id
-        from app.services.transcript_analyzer import analyze_transcript
-
-        call_id = save_store_call_transcript(vapi_call_id, transcript, transcript_messages)
-        if not call_id:
-            logger.warning("No store_call found for vapi_call_id=%s", vapi_call_id)
-            return
-
-        sc = get_store_call_by_vapi_id(vapi_call_id)
+        await _wait_store_tool_saves(vapi_call_id)
+        sc = await asyncio.to_thread(save_store_call_transcript, vapi_call_id, transcript, transcript_messages)
         if not sc:
+            logger.warning("No store_call found for vapi_call_id=%s", vapi_call_id)
             return
 
-        from app.db.connection import get_connection
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT tool_calls_raw FROM store_calls WHERE id = %s", (call_id,))
-                row = cur.fetchone()
-        tool_calls_made = row[0] if row and row[0] else []
-
         await analyze_transcript(
             ticket_id=sc["ticket_id"],
-            store_call_id=call_id,
+            store_call_id=sc["id"],
             transcript=transcript,
-            tool_calls_made=tool_calls_made,
+            tool_calls_made=sc["tool_calls_raw"],
             ended_reason=ended_reason,
         )
-        logger.info("Transcript analysis complete for store_call %s (ticket %s)", call_id, sc["ticket_id"])
+        logger.info("Transcript analysis complete for store_call %s (ticket %s)", sc["id"], sc["ticket_id"])
 
     except Exception:
         logger.exception("Store transcript handling failed for vapi_call_id=%s", vapi_call_id)
@@ -361,19 +568,12 @@ async def _handle_store_no_transcript(vapi_call_id: str, ended_reason: str) -> N
     schedule a callback after STORE_CALL_RETRY_DELAY_SECONDS (default 2 min).
     """
     try:
-        from app.db.tickets import (
-            get_store_call_by_vapi_id, update_store_call_status,
-            save_store_call_analysis, count_pending_calls,
-            get_store_call_retry_count,
-        )
-        from app.services.transcript_analyzer import _compile_final_result
-
-        sc = get_store_call_by_vapi_id(vapi_call_id)
+        sc = await asyncio.to_thread(get_store_call_by_vapi_id, vapi_call_id)
         if not sc:
             logger.warning("No store_call found for vapi_call_id=%s (no transcript)", vapi_call_id)
             return
 
-        retry_count = get_store_call_retry_count(sc["id"])
+        retry_count = await asyncio.to_thread(get_store_call_retry_count, sc["id"])
         max_retries = Config.STORE_CALL_MAX_RETRIES
 
         if ended_reason in _RETRYABLE_ENDED_REASONS and retry_count < max_retries:
@@ -384,8 +584,8 @@ async def _handle_store_no_transcript(vapi_call_id: str, ended_reason: str) -> N
                 "Scheduling retry %d/%d in %ds",
                 sc["id"], vapi_call_id, ended_reason, attempt, max_retries, delay,
             )
-            update_store_call_status(sc["id"], "retry_scheduled")
-            asyncio.create_task(_retry_store_call(sc, delay))
+            await asyncio.to_thread(update_store_call_status, sc["id"], "retry_scheduled")
+            _spawn(_retry_store_call(sc, delay))
             return
 
         failure_reasons = {
@@ -401,7 +601,7 @@ async def _handle_store_no_transcript(vapi_call_id: str, ended_reason: str) -> N
         if ended_reason in _RETRYABLE_ENDED_REASONS and retry_count >= max_retries:
             note += f" (after {retry_count + 1} attempts)"
 
-        save_store_call_analysis(sc["id"], {
+        await asyncio.to_thread(save_store_call_analysis, sc["id"], {
             "product_available": None,
             "matched_product": None,
             "price": None,
@@ -419,7 +619,7 @@ async def _handle_store_no_transcript(vapi_call_id: str, ended_reason: str) -> N
         logger.info("Store call %s (vapi=%s) ended without transcript: %s",
                      sc["id"], vapi_call_id, note)
 
-        pending = count_pending_calls(sc["ticket_id"])
+        pending = await asyncio.to_thread(count_pending_calls, sc["ticket_id"])
         if pending == 0:
             await _compile_final_result(sc["ticket_id"])
 
@@ -432,42 +632,33 @@ async def _retry_store_call(sc: dict, delay_seconds: int) -> None:
     try:
         await asyncio.sleep(delay_seconds)
 
-        from app.db.tickets import (
-            get_store_by_id, get_product, get_ticket,
-            reset_store_call_for_retry, update_store_call_status,
-            get_store_call_retry_count, log_tool_call,
-        )
-        from app.services.store_caller import _build_store_prompt
-        from app.services.vapi_client import create_store_phone_call
-        from app.helpers.regional import detect_region
-
-        store = get_store_by_id(sc["store_id"])
+        store = await asyncio.to_thread(get_store_by_id, sc["store_id"])
         if not store:
             logger.error("Retry aborted: store %s not found", sc["store_id"])
-            update_store_call_status(sc["id"], "failed")
+            await asyncio.to_thread(update_store_call_status, sc["id"], "failed")
             return
 
-        ticket = get_ticket(sc["ticket_id"])
+        ticket = await asyncio.to_thread(get_ticket, sc["ticket_id"])
         if not ticket:
             logger.error("Retry aborted: ticket %s not found", sc["ticket_id"])
-            update_store_call_status(sc["id"], "failed")
+            await asyncio.to_thread(update_store_call_status, sc["id"], "failed")
             return
 
-        product = get_product(sc["ticket_id"])
+        product = await asyncio.to_thread(get_product, sc["ticket_id"])
         if not product:
             logger.error("Retry aborted: no product for ticket %s", sc["ticket_id"])
-            update_store_call_status(sc["id"], "failed")
+            await asyncio.to_thread(update_store_call_status, sc["id"], "failed")
             return
 
         phone = store.get("phone_number")
         if not phone:
             logger.error("Retry aborted: no phone for store %s", store.get("store_name"))
-            update_store_call_status(sc["id"], "failed")
+            await asyncio.to_thread(update_store_call_status, sc["id"], "failed")
             return
 
         location = ticket.get("location", "")
         customer_name = ticket.get("user_name")
-        retry_num = get_store_call_retry_count(sc["id"]) + 1
+        retry_num = await asyncio.to_thread(get_store_call_retry_count, sc["id"]) + 1
 
         prompt, region, first_message = _build_store_prompt(
             product, location, store["store_name"],
@@ -491,21 +682,22 @@ async def _retry_store_call(sc: dict, delay_seconds: int) -> None:
         if vapi_result.get("success"):
             new_vapi_call_id = vapi_result.get("call", {}).get("id")
             if new_vapi_call_id:
-                reset_store_call_for_retry(sc["id"], new_vapi_call_id)
+                await asyncio.to_thread(reset_store_call_for_retry, sc["id"], new_vapi_call_id)
                 logger.info(
                     "Store call %s retry successful, new vapi_call_id=%s",
                     sc["id"], new_vapi_call_id,
                 )
             else:
-                update_store_call_status(sc["id"], "failed")
+                await asyncio.to_thread(update_store_call_status, sc["id"], "failed")
         else:
             logger.error(
                 "Store call %s retry VAPI call failed: %s",
                 sc["id"], vapi_result.get("error"),
             )
-            update_store_call_status(sc["id"], "failed")
+            await asyncio.to_thread(update_store_call_status, sc["id"], "failed")
 
-        log_tool_call(
+        await asyncio.to_thread(
+            log_tool_call,
             sc["ticket_id"], "vapi_retry_store_call",
             {"store": store["store_name"], "phone": phone, "retry_attempt": retry_num},
             vapi_result,
@@ -1,10 +1,15 @@
 """Tool handler functions for VAPI function calling (wakeup + store calls)."""
-import json
+import asyncio
 import logging
-import time
+import threading
+from time import monotonic
 from typing import Dict, Any, Optional
 
-from app.db.tickets import log_tool_call, get_store_call_by_vapi_id
+import orjson
+
+from app.db.tickets import log_tool_calls, get_store_call_by_vapi_id
+from app.db.wakeup import schedule_wakeup_in_minutes, set_never_call_again, set_daily_wakeup_time
+from app.services.wakeup_scheduler import normalize_phone
 
 logger = logging.getLogger(__name__)
 
@@ -15,10 +20,8 @@ DEFAULT_USER_ID = "default_user"
 # Wake-up call handlers (unchanged)
 # ---------------------------------------------------------------------------
 
-def schedule_wakeup_call(minutes: int, user_id: Optional[str] = None) -> Dict[str, Any]:
+def schedule_wakeup_call(minutes: int, user_id: Optional[str] = None, **_: Any) -> Dict[str, Any]:
     try:
-        from app.db.wakeup import schedule_wakeup_in_minutes
-        from app.services.wakeup_scheduler import normalize_phone
         uid = user_id or DEFAULT_USER_ID
         if uid != DEFAULT_USER_ID:
             uid = normalize_phone(uid)
@@ -28,9 +31,8 @@ def schedule_wakeup_call(minutes: int, user_id: Optional[str] = None) -> Dict[st
         return {"success": False, "error": str(e)}
 
 
-def never_call_again(user_id: Optional[str] = None) -> Dict[str, Any]:
+def never_call_again(user_id: Optional[str] = None, **_: Any) -> Dict[str, Any]:
     try:
-        from app.db.wakeup import set_never_call_again
         uid = user_id or DEFAULT_USER_ID
         return set_never_call_again(uid)
     except Exception as e:
@@ -38,11 +40,10 @@ def never_call_again(user_id: Optional[str] = None) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
-def set_daily_wakeup_time_handler(time_str: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+def set_daily_wakeup_time_handler(time: str, user_id: Optional[str] = None, **_: Any) -> Dict[str, Any]:
     try:
-        from app.db.wakeup import set_daily_wakeup_time
         uid = user_id or DEFAULT_USER_ID
-        return set_daily_wakeup_time(uid, time_str)
+        return set_daily_wakeup_time(uid, time)
     except Exception as e:
         logger.exception("set_daily_wakeup_time failed")
         return {"success": False, "error": str(e)}
@@ -52,15 +53,16 @@ def set_daily_wakeup_time_handler(time_str: str, user_id: Optional[str] = None)
 # Store call handlers – called during VAPI store inquiry calls
 # ---------------------------------------------------------------------------
 
+_AVAILABILITY = ("not available", "available")
+
 def report_product_availability(
     product_name: str, available: bool,
     price: Optional[float] = None, notes: Optional[str] = None,
-    _vapi_call_id: Optional[str] = None,
+    _vapi_call_id: Optional[str] = None, **_: Any,
 ) -> Dict[str, Any]:
     result = {
         "success": True,
-        "message": f"Noted: {product_name} is {'available' if available else 'not available'}."
-        + (f" Price: ₹{price}" if price else ""),
+        "message": f"Noted: {product_name} is {_AVAILABILITY[bool(available)]}.{f' Price: ₹{price}' if price else ''}",
     }
     _log_store_tool("report_product_availability", {
         "product_name": product_name, "available": available, "price": price, "notes": notes,
@@ -72,12 +74,11 @@ def report_delivery_info(
     delivers: bool,
     eta: Optional[str] = None, delivery_mode: Optional[str] = None,
     delivery_charge: Optional[float] = None,
-    _vapi_call_id: Optional[str] = None,
+    _vapi_call_id: Optional[str] = None, **_: Any,
 ) -> Dict[str, Any]:
     result = {
         "success": True,
-        "message": f"Noted: delivery {'available' if delivers else 'not available'}."
-        + (f" ETA: {eta}" if eta else ""),
+        "message": f"Noted: delivery {_AVAILABILITY[bool(delivers)]}.{f' ETA: {eta}' if eta else ''}",
     }
     _log_store_tool("report_delivery_info", {
         "delivers": delivers, "eta": eta, "delivery_mode": delivery_mode,
@@ -89,12 +90,14 @@ def report_delivery_info(
 def report_alternative_product(
     alternative_name: str, available: bool,
     price: Optional[float] = None, notes: Optional[str] = None,
-    _vapi_call_id: Optional[str] = None,
+    _vapi_call_id: Optional[str] = None, **_: Any,
 ) -> Dict[str, Any]:
     result = {
         "success": True,
-        "message": f"Noted: alternative {alternative_name} is {'available' if available else 'not available'}."
-        + (f" Price: ₹{price}" if price else ""),
+        "message": (
+            f"Noted: alternative {alternative_name} is {_AVAILABILITY[bool(available)]}."
+            f"{f' Price: ₹{price}' if price else ''}"
+        ),
     }
     _log_store_tool("report_alternative_product", {
         "alternative_name": alternative_name, "available": available, "price": price, "notes": notes,
@@ -102,84 +105,142 @@ def report_alternative_product(
     return result
 
 
+# vapi_call_id -> (store_call id, ticket_id). Neither changes once the row has
+# its VAPI id, so entries never go stale; misses aren't cached because a tool
+# call can race the vapi_call_id being written. Handlers run in worker threads,
+# so dict access holds the lock (the DB lookup on a miss runs outside it).
+_STORE_CALL_KEYS: dict[str, tuple[int, str]] = {}
+_STORE_CALL_KEYS_MAX = 4096
+_STORE_CALL_KEYS_LOCK = threading.Lock()
+
+
+def _store_call_keys(vapi_call_id: str) -> Optional[tuple[int, str]]:
+    with _STORE_CALL_KEYS_LOCK:
+        keys = _STORE_CALL_KEYS.get(vapi_call_id)
+    if keys is None:
+        sc = get_store_call_by_vapi_id(vapi_call_id)
+        if not sc:
+            return None
+        keys = (sc["id"], sc["ticket_id"])
+        with _STORE_CALL_KEYS_LOCK:
+            _STORE_CALL_KEYS[vapi_call_id] = keys
+            if len(_STORE_CALL_KEYS) > _STORE_CALL_KEYS_MAX:
+                _STORE_CALL_KEYS.pop(next(iter(_STORE_CALL_KEYS)), None)
+    return keys
+
+
+# Store tool logs are queued per call and written in one batch by
+# flush_store_tool_logs() once the webhook's tools have all run. A tool that
+# finishes after its call's last flush leaves an entry nobody will pop, so
+# entries idle for _PENDING_STORE_LOGS_TTL_SEC are dropped and the dict is capped.
+# Appends move an entry to the end, so the oldest idle entries are always first.
+_PENDING_STORE_LOGS: dict[str, tuple[float, list[tuple[str, dict, dict]]]] = {}
+_PENDING_STORE_LOGS_LOCK = threading.Lock()
+_PENDING_STORE_LOGS_MAX = 1024
+_PENDING_STORE_LOGS_TTL_SEC = 600
+
+
 def _log_store_tool(tool_name: str, params: dict, result: dict, vapi_call_id: Optional[str]) -> None:
-    """Persist tool call log for a store call."""
+    """Queue a tool call log for a store call."""
     if not vapi_call_id:
         return
+    now = monotonic()
+    dropped = 0
+    with _PENDING_STORE_LOGS_LOCK:
+        _, pending = _PENDING_STORE_LOGS.pop(vapi_call_id, (None, []))
+        pending.append((tool_name, params, result))
+        _PENDING_STORE_LOGS[vapi_call_id] = (now, pending)
+        while len(_PENDING_STORE_LOGS) > 1:
+            oldest = next(iter(_PENDING_STORE_LOGS))
+            touched_at, stale = _PENDING_STORE_LOGS[oldest]
+            if now - touched_at < _PENDING_STORE_LOGS_TTL_SEC and len(_PENDING_STORE_LOGS) <= _PENDING_STORE_LOGS_MAX:
+                break
+            del _PENDING_STORE_LOGS[oldest]
+            dropped += len(stale)
+    if dropped:
+        logger.warning("Dropped %d unflushed store tool log(s)", dropped)
+
+
+def flush_store_tool_logs(vapi_call_id: str) -> None:
+    """Persist all queued tool call logs for a store call in one insert."""
+    with _PENDING_STORE_LOGS_LOCK:
+        _, pending = _PENDING_STORE_LOGS.pop(vapi_call_id, (None, None))
+    if not pending:
+        return
     try:
-        sc = get_store_call_by_vapi_id(vapi_call_id)
-        if sc:
-            log_tool_call(
-                ticket_id=sc["ticket_id"], tool_name=tool_name,
-                input_params=params, output_result=result,
-                store_call_id=sc["id"],
-            )
+        keys = _store_call_keys(vapi_call_id)
+        if keys:
+            store_call_id, ticket_id = keys
+            log_tool_calls([
+                {
+                    "ticket_id": ticket_id, "tool_name": tool_name,
+                    "input_params": params, "output_result": result,
+                    "store_call_id": store_call_id,
+                }
+                for tool_name, params, result in pending
+            ])
     except Exception:
-        logger.exception("Failed to log store tool call")
+        logger.exception("Failed to log store tool calls")
 
 
 # ---------------------------------------------------------------------------
 # Tool registries
 # ---------------------------------------------------------------------------
 
+# Handlers take the VAPI argument names directly and ignore any extras the
+# model sends, so they are registered as-is.
 WAKEUP_TOOL_HANDLERS: Dict[str, Any] = {
-    "schedule_wakeup_call": lambda **kw: schedule_wakeup_call(
-        minutes=kw["minutes"], user_id=kw.get("user_id"),
-    ),
-    "never_call_again": lambda **kw: never_call_again(user_id=kw.get("user_id")),
-    "set_daily_wakeup_time": lambda **kw: set_daily_wakeup_time_handler(
-        time_str=kw["time"], user_id=kw.get("user_id"),
-    ),
+    "schedule_wakeup_call": schedule_wakeup_call,
+    "never_call_again": never_call_again,
+    "set_daily_wakeup_time": set_daily_wakeup_time_handler,
 }
 
 STORE_TOOL_HANDLERS: Dict[str, Any] = {
-    "report_product_availability": lambda **kw: report_product_availability(
-        product_name=kw["product_name"], available=kw["available"],
-        price=kw.get("price"), notes=kw.get("notes"),
-        _vapi_call_id=kw.get("_vapi_call_id"),
-    ),
-    "report_delivery_info": lambda **kw: report_delivery_info(
-        delivers=kw["delivers"], eta=kw.get("eta"),
-        delivery_mode=kw.get("delivery_mode"), delivery_charge=kw.get("delivery_charge"),
-        _vapi_call_id=kw.get("_vapi_call_id"),
-    ),
-    "report_alternative_product": lambda **kw: report_alternative_product(
-        alternative_name=kw["alternative_name"], available=kw["available"],
-        price=kw.get("price"), notes=kw.get("notes"),
-        _vapi_call_id=kw.get("_vapi_call_id"),
-    ),
+    "report_product_availability": report_product_availability,
+    "report_delivery_info": report_delivery_info,
+    "report_alternative_product": report_alternative_product,
 }
 
 # Combined registry (backward compat)
 TOOL_HANDLERS: Dict[str, Any] = {**WAKEUP_TOOL_HANDLERS, **STORE_TOOL_HANDLERS}
 
+# Classified once so execute_tool doesn't introspect the handler per call.
+_ASYNC_HANDLERS = frozenset(
+    name for name, handler in TOOL_HANDLERS.items() if asyncio.iscoroutinefunction(handler)
+)
+
 
-async def execute_tool(function_name: str, arguments: str, extra_context: dict | None = None) -> Dict[str, Any]:
+async def execute_tool(
+    function_name: str, arguments: dict | str | bytes, extra_context: dict | None = None,
+) -> Dict[str, Any]:
     """
     Execute a tool function with the given arguments.
+    arguments may be an already-parsed dict (copied, never mutated) or a JSON string.
     extra_context can carry _vapi_call_id and similar metadata.
     """
-    try:
-        args = json.loads(arguments)
-    except json.JSONDecodeError as e:
-        logger.error("Failed to parse arguments for %s: %s", function_name, e)
-        return {"error": f"Invalid JSON arguments: {e}"}
+    if isinstance(arguments, dict):
+        args = dict(arguments)
+    else:
+        try:
+            args = orjson.loads(arguments)
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to parse arguments for %s: %s", function_name, e)
+            return {"error": f"Invalid JSON arguments: {e}"}
 
     if extra_context:
         args.update(extra_context)
 
-    if function_name not in TOOL_HANDLERS:
+    handler = TOOL_HANDLERS.get(function_name)
+    if handler is None:
         logger.error("Unknown function: %s", function_name)
         return {"error": f"Unknown function: {function_name}"}
 
-    handler = TOOL_HANDLERS[function_name]
-
     try:
-        import asyncio
-        if asyncio.iscoroutinefunction(handler):
+        if function_name in _ASYNC_HANDLERS:
             result = await handler(**args)
         else:
-            result = handler(**args)
+            # Sync handlers write to the DB; keep them off the event loop.
+            result = await asyncio.to_thread(handler, **args)
         return result
     except Exception as e:
         logger.error("Error executing function %s: %s", function_name, e, exc_info=True)
@@ -1,8 +1,10 @@
 """OpenAI-style tool definitions for VAPI (function calling over phone)."""
+from functools import lru_cache
 
 
+@lru_cache(maxsize=1)
 def get_vapi_wakeup_tools() -> list[dict]:
-    """Return wake-up call tools in OpenAI/VAPI function format."""
+    """Return wake-up call tools in OpenAI/VAPI function format (cached; treat as read-only)."""
     return [
         {
             "type": "function",
@@ -67,8 +69,9 @@ def get_vapi_wakeup_tools() -> list[dict]:
     ]
 
 
+@lru_cache(maxsize=1)
 def get_store_call_tools() -> list[dict]:
-    """Return tools used during store inquiry calls."""
+    """Return tools used during store inquiry calls (cached; treat as read-only)."""
     return [
         {
             "type": "function",
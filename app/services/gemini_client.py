@@ -1,15 +1,15 @@
 """Gemini AI client — intelligent query analysis and store re-ranking."""
-import json
-import time
 import logging
 from typing import Any
 
+import orjson
 from google import genai
 from google.genai import types
 
 from app.helpers.config import Config
-from app.db.tickets import log_llm_call
 from app.helpers.prompt_loader import PromptLoader
+from app.helpers.timing import timed
+from app.services import log_sink
 
 logger = logging.getLogger(__name__)
 
@@ -36,125 +36,150 @@ async def analyze_query(ticket_id: str, query: str, location: str) -> dict[str,
 
     user_message = f"Query: {query}\nLocation: {location}"
 
-    start = time.time()
     client = _get_client()
 
-    response = await client.aio.models.generate_content(
-        model=Config.GEMINI_MODEL,
-        contents=f"{system_prompt}\n\n{user_message}",
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            temperature=0.1,
-        ),
-    )
+    with timed() as t:
+        response = await client.aio.models.generate_content(
+            model=Config.GEMINI_MODEL,
+            contents=f"{system_prompt}\n\n{user_message}",
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                temperature=0.1,
+            ),
+        )
 
     raw = response.text or "{}"
-    latency = int((time.time() - start) * 1000)
-    result = json.loads(raw)
+    result = orjson.loads(raw)
+    if not isinstance(result, dict):
+        logger.warning("Ticket %s: query analysis was not a JSON object, ignoring it", ticket_id)
+        result = {}
 
     usage = getattr(response, "usage_metadata", None)
-    log_llm_call(
+    log_sink.enqueue("llm_call", dict(
         ticket_id=ticket_id, step="query_analyzer", model=Config.GEMINI_MODEL,
         prompt_template="query_analyzer.txt",
         input_data={"query": query, "location": location},
-        output_data=result, raw_response=raw,
+        # Copied: the log is written later and result is patched below.
+        output_data=dict(result), raw_response=raw,
         tokens_input=getattr(usage, "prompt_token_count", 0) if usage else 0,
         tokens_output=getattr(usage, "candidates_token_count", 0) if usage else 0,
-        latency_ms=latency,
-    )
-
-    if "search_queries" not in result or not result["search_queries"]:
-        result["search_queries"] = [f"{query} near {location}"]
+        latency_ms=t.ms,
+    ))
+
+    search_queries = result.get("search_queries")
+    if isinstance(search_queries, str):
+        search_queries = [search_queries]
+    elif isinstance(search_queries, list):
+        search_queries = [q for q in search_queries if isinstance(q, str) and q.strip()]
+    else:
+        search_queries = None
+    result["search_queries"] = search_queries or [f"{query} near {location}"]
 
     return result
 
 
+# Constant parts of the rerank prompt, built once at import.
+_RERANK_STORE_FIELDS = ("name", "address", "rating", "total_ratings", "distance_km")
+
+_CRITERIA_SPECIFIC = (
+    "Highest priority: exact or close name match to the requested store. "
+    "Among matching stores, prefer the NEAREST one (lowest distance_km). "
+    "Non-matching stores go last, ranked by category relevance then rating."
+)
+_CRITERIA_GENERIC = (
+    "Rank by: category relevance, then rating, then proximity (lower distance_km is better)."
+)
+
+_RERANK_TEMPLATE = """User query: "{query}"
+Specific store requested: "{specific}"
+Product category: "{cat}"
+
+Stores found:
+{summary}
+
+Re-rank by relevance. {criteria}
+
+Respond JSON only:
+{{"ranked_indices": [0, 2, 1], "reasoning": "brief explanation"}}"""
+
+
 async def rerank_stores(
     ticket_id: str, query: str, stores: list[dict], query_analysis: dict,
 ) -> list[dict]:
     """
     Use Gemini to re-rank store results based on relevance to the query.
     Prioritizes exact store name matches, then category relevance.
+    Skipped when there are too few stores, or nothing beyond find_stores'
+    rating order for Gemini to rank by.
     """
-    if not stores or len(stores) <= 1:
+    if not stores or len(stores) < max(Config.RERANK_MIN_STORES, 2):
         return stores
 
-    client = _get_client()
-
-    stores_summary = json.dumps([
-        {
-            "idx": i,
-            "name": s.get("name"),
-            "address": s.get("address"),
-            "rating": s.get("rating"),
-            "total_ratings": s.get("total_ratings"),
-            "distance_km": s.get("distance_km"),
-        }
-        for i, s in enumerate(stores)
-    ], indent=2)
-
-    specific_store = query_analysis.get("specific_store_name") or ""
-    product_cat = query_analysis.get("product_category") or ""
-    is_specific = query_analysis.get("is_specific_store", False)
-
-    if is_specific:
-        ranking_criteria = (
-            "Highest priority: exact or close name match to the requested store. "
-            "Among matching stores, prefer the NEAREST one (lowest distance_km). "
-            "Non-matching stores go last, ranked by category relevance then rating."
-        )
-    else:
-        ranking_criteria = (
-            "Rank by: category relevance, then rating, then proximity (lower distance_km is better)."
-        )
+    specific_store = (query_analysis.get("specific_store_name") or "").strip()
+    product_cat = (query_analysis.get("product_category") or "").strip()
+    if not specific_store and not product_cat:
+        logger.info("Ticket %s: no store name or category to rank by, keeping search order", ticket_id)
+        return stores
 
-    prompt = f"""User query: "{query}"
-Specific store requested: "{specific_store}"
-Product category: "{product_cat}"
+    client = _get_client()
 
-Stores found:
-{stores_summary}
+    # Serialize row by row into one buffer: one small dict per store, no list.
+    buf = bytearray(b"[")
+    for i, s in enumerate(stores):
+        if i:
+            buf += b","
+        row = {"idx": i}
+        for k in _RERANK_STORE_FIELDS:
+            v = s.get(k)
+            if v is not None:
+                row[k] = v
+        buf += orjson.dumps(row)
+    buf += b"]"
+    stores_summary = buf.decode()
 
-Re-rank by relevance. {ranking_criteria}
+    is_specific = query_analysis.get("is_specific_store", False)
 
-Respond JSON only:
-{{"ranked_indices": [0, 2, 1], "reasoning": "brief explanation"}}"""
+    prompt = _RERANK_TEMPLATE.format(
+        query=query, specific=specific_store, cat=product_cat, summary=stores_summary,
+        criteria=_CRITERIA_SPECIFIC if is_specific else _CRITERIA_GENERIC,
+    )
 
     try:
-        start = time.time()
-        response = await client.aio.models.generate_content(
-            model=Config.GEMINI_MODEL,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                temperature=0.0,
-            ),
-        )
+        with timed() as t:
+            response = await client.aio.models.generate_content(
+                model=Config.GEMINI_MODEL,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    temperature=0.0,
+                ),
+            )
         raw = response.text or "{}"
-        result = json.loads(raw)
-        latency = int((time.time() - start) * 1000)
+        result = orjson.loads(raw)
 
         usage = getattr(response, "usage_metadata", None)
-        log_llm_call(
+        log_sink.enqueue("llm_call", dict(
             ticket_id=ticket_id, step="store_reranking", model=Config.GEMINI_MODEL,
             prompt_template="inline",
             input_data={"query": query, "store_count": len(stores)},
             output_data=result, raw_response=raw,
             tokens_input=getattr(usage, "prompt_token_count", 0) if usage else 0,
             tokens_output=getattr(usage, "candidates_token_count", 0) if usage else 0,
-            latency_ms=latency,
-        )
-
-        indices = result.get("ranked_indices", [])
+            latency_ms=t.ms,
+        ))
+
+        indices = result.get("ranked_indices") if isinstance(result, dict) else None
+        if not isinstance(indices, list):
+            logger.warning("Ticket %s: rerank reply had no ranked_indices list", ticket_id)
+            return stores
+        n = len(stores)
         reranked = []
-        seen = set()
+        seen = [False] * n
         for i in indices:
-            if isinstance(i, int) and 0 <= i < len(stores) and i not in seen:
+            if isinstance(i, int) and 0 <= i < n and not seen[i]:
                 reranked.append(stores[i])
-                seen.add(i)
-        for i, s in enumerate(stores):
-            if i not in seen:
-                reranked.append(s)
+                seen[i] = True
+        reranked.extend(s for i, s in enumerate(stores) if not seen[i])
         return reranked
 
     except Exception:
@@ -1,17 +1,82 @@
 """Google Maps Geocoding – forward and reverse geocode for addresses."""
+import asyncio
 import re
+import time
 import logging
 from typing import Any, Optional
 
-import aiohttp
+import orjson
 
 from app.helpers.config import Config
+from app.helpers.http_client import get_session
 
 logger = logging.getLogger(__name__)
 
 GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
 
-_INDIA_PINCODE_RE = re.compile(r"\b[1-9]\d{5}\b")
+_INDIA_PINCODE_RE = re.compile(r"\b[1-9]\d{5}\b", re.ASCII)
+_ADDRESS_SPLIT_RE = re.compile(r"\s*,\s*")
+
+
+def _normalize_address(address: str) -> str:
+    """Cache-key form of an address (the original text is what gets geocoded).
+
+    'HSR Layout ,  Bangalore.' → 'hsr layout, bangalore'
+    """
+    parts = (" ".join(p.split()).strip(".;:-") for p in _ADDRESS_SPLIT_RE.split((address or "").lower()))
+    return ", ".join(p for p in parts if p)
+
+
+# Geocodes barely change and the same city/pincode recurs across tickets, so
+# successful lookups are kept for a day. Failures are not cached.
+_GEOCODE_TTL_SECONDS = 86400
+_GEOCODE_CACHE_MAX = 2048
+_geocode_cache: dict[tuple, tuple[float, dict[str, Any]]] = {}
+
+
+def _cache_get(key: tuple) -> Optional[dict[str, Any]]:
+    hit = _geocode_cache.get(key)
+    if hit is None:
+        return None
+    if hit[0] < time.monotonic():
+        _geocode_cache.pop(key, None)
+        return None
+    return dict(hit[1])
+
+
+def _cache_put(key: tuple, value: dict[str, Any]) -> None:
+    if len(_geocode_cache) >= _GEOCODE_CACHE_MAX:
+        _geocode_cache.pop(next(iter(_geocode_cache)), None)
+    _geocode_cache[key] = (time.monotonic() + _GEOCODE_TTL_SECONDS, dict(value))
+
+
+def clear_geocode_cache() -> None:
+    _geocode_cache.clear()
+
+
+# One shared fetch per key, so concurrent tickets for the same address wait for
+# a single request (and share its failure) instead of all hitting the API.
+_inflight: dict[tuple, asyncio.Task] = {}
+
+
+async def _fetch_and_cache(key: tuple, fetch) -> Optional[dict[str, Any]]:
+    result = await fetch()
+    if result is not None:
+        _cache_put(key, result)
+    return result
+
+
+async def _cached_lookup(key: tuple, fetch) -> Optional[dict[str, Any]]:
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_fetch_and_cache(key, fetch))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded so one caller being cancelled doesn't cancel the others' fetch.
+    result = await asyncio.shield(task)
+    return dict(result) if result is not None else None
 
 
 def extract_pincode(address: str) -> Optional[str]:
@@ -20,23 +85,29 @@ def extract_pincode(address: str) -> Optional[str]:
     return match.group(0) if match else None
 
 
+# component type -> (result field, keep first occurrence only)
+_COMPONENT_FIELDS: dict[str, tuple[str, bool]] = {
+    "postal_code": ("pincode", False),
+    "locality": ("city", False),
+    "administrative_area_level_1": ("state", False),
+    "sublocality_level_1": ("area", True),
+    "route": ("street", True),
+    "street_number": ("street_number", True),
+}
+
+
 def _parse_address_components(components: list[dict]) -> dict[str, str]:
     """Extract structured fields from Google geocoding address_components."""
     result: dict[str, str] = {}
     for comp in components:
-        types = comp.get("types", [])
-        if "postal_code" in types:
-            result["pincode"] = comp["long_name"]
-        elif "locality" in types:
-            result["city"] = comp["long_name"]
-        elif "administrative_area_level_1" in types:
-            result["state"] = comp["long_name"]
-        elif "sublocality_level_1" in types:
-            result.setdefault("area", comp["long_name"])
-        elif "route" in types:
-            result.setdefault("street", comp["long_name"])
-        elif "street_number" in types:
-            result.setdefault("street_number", comp["long_name"])
+        for t in comp.get("types", ()):
+            spec = _COMPONENT_FIELDS.get(t)
+            if spec is None:
+                continue
+            field, first_only = spec
+            if not first_only or field not in result:
+                result[field] = comp["long_name"]
+            break
     return result
 
 
@@ -49,6 +120,11 @@ async def geocode_address(address: str) -> Optional[dict[str, Any]]:
         logger.error("GOOGLE_MAPS_API_KEY not set – cannot geocode")
         return None
 
+    cache_key = ("fwd", _normalize_address(address))
+    return await _cached_lookup(cache_key, lambda: _fetch_geocode(address))
+
+
+async def _fetch_geocode(address: str) -> Optional[dict[str, Any]]:
     params = {
         "address": address,
         "key": Config.GOOGLE_MAPS_API_KEY,
@@ -56,9 +132,8 @@ async def geocode_address(address: str) -> Optional[dict[str, Any]]:
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(GEOCODE_URL, params=params) as resp:
-                data = await resp.json()
+        async with get_session().get(GEOCODE_URL, params=params) as resp:
+            data = await resp.json(loads=orjson.loads)
     except Exception:
         logger.exception("Geocoding request failed for %r", address)
         return None
@@ -91,15 +166,20 @@ async def reverse_geocode(lat: float, lng: float) -> Optional[dict[str, Any]]:
         logger.error("GOOGLE_MAPS_API_KEY not set – cannot reverse geocode")
         return None
 
+    # ~11 m buckets: well inside a pincode/locality.
+    cache_key = ("rev", round(lat, 4), round(lng, 4))
+    return await _cached_lookup(cache_key, lambda: _fetch_reverse(lat, lng))
+
+
+async def _fetch_reverse(lat: float, lng: float) -> Optional[dict[str, Any]]:
     params = {
         "latlng": f"{lat},{lng}",
         "key": Config.GOOGLE_MAPS_API_KEY,
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(GEOCODE_URL, params=params) as resp:
-                data = await resp.json()
+        async with get_session().get(GEOCODE_URL, params=params) as resp:
+            data = await resp.json(loads=orjson.loads)
     except Exception:
         logger.exception("Reverse geocoding failed for (%s, %s)", lat, lng)
         return None
@@ -1,40 +1,90 @@
 """Google Maps Places API – multi-strategy store discovery with deduplication."""
+import asyncio
+import heapq
 import logging
 import math
-import time
-from typing import Any
+import random
+import re
+from typing import Any, Callable
 
 import aiohttp
+import orjson
 
 from app.helpers.config import Config
-from app.db.tickets import save_stores, log_tool_call
+from app.helpers.http_client import get_session
+from app.helpers.timing import timed
+from app.db.tickets import save_stores
+from app.services import log_sink
 from app.services.geocoding import geocode_address
 
 logger = logging.getLogger(__name__)
 
-TEXT_SEARCH_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-PLACE_DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+# Places API (New): one searchText call returns everything a store record
+# needs (phone, hours, location), so no per-place Details requests. Only
+# fields something downstream reads are masked in; each one can raise the
+# billed SKU and adds to every response.
+SEARCH_TEXT_URL = "https://places.googleapis.com/v1/places:searchText"
+SEARCH_FIELD_MASK = ",".join((
+    "places.id",
+    "places.displayName",
+    "places.formattedAddress",
+    "places.internationalPhoneNumber",
+    "places.nationalPhoneNumber",
+    "places.rating",
+    "places.userRatingCount",
+    "places.location",
+    "places.currentOpeningHours.openNow",
+))
+MAX_RESULTS_PER_QUERY = 20
+
+# Quota (429) and server-side (5xx) failures are usually transient; retry
+# those and connection errors with jittered exponential backoff.
+# Lower-priority searches are only sent while the candidate heap still has
+# room; this many run ahead of the one being merged to hide their latency.
+SEARCH_LOOKAHEAD = 1
+SEARCH_ATTEMPTS = 3
+RETRY_BASE_DELAY_SEC = 0.25
+_RETRY_HTTP_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _location_parts(location: str) -> list[str]:
+    """Lowercased comma-separated parts of a location worth matching (3+ chars)."""
+    return [p for p in (p.strip().lower() for p in location.split(",")) if len(p) >= 3]
+
+
+def _has_location_overlap(query_low: str, location_parts: list[str]) -> bool:
+    """Check if any significant part of the location already appears in the query."""
+    return any(part in query_low for part in location_parts)
 
 
-def _has_location_overlap(query: str, location: str) -> bool:
-    """Check if any significant part of the location already appears in the query."""
-    location_parts = [p.strip().lower() for p in location.split(",")]
-    query_low = query.lower()
-    for part in location_parts:
-        if len(part) >= 3 and part in query_low:
-            return True
-    return False
+_EARTH_RADIUS_KM = 6371.0
+
+
+def _distance_from(lat1: float, lon1: float) -> Callable[[float, float], float]:
+    """Haversine km-distance function from a fixed origin.
+
+    The origin's radians and cosine are computed once, so ranking N stores
+    against the user's location does that trig once instead of N times.
+    """
+    phi1 = math.radians(lat1)
+    lam1 = math.radians(lon1)
+    cos_phi1 = math.cos(phi1)
+
+    def distance_km(lat2: float, lon2: float) -> float:
+        phi2 = math.radians(lat2)
+        a = (math.sin((phi2 - phi1) / 2) ** 2
+             + cos_phi1 * math.cos(phi2) * math.sin((math.radians(lon2) - lam1) / 2) ** 2)
+        # atan2 form stays accurate near antipodal points where asin(sqrt(a))
+        # flattens out; clamp guards rounding that pushes a just past 1.
+        a = min(a, 1.0)
+        return _EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
+    return distance_km
 
-def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Great-circle distance between two points in km."""
-    R = 6371.0
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) ** 2
-         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2))
-         * math.sin(dlon / 2) ** 2)
-    return R * 2 * math.asin(math.sqrt(a))
+
+# Address parts that are unit/building details rather than an area name.
+# "no" only counts as "no." / "no " so names like Noida survive.
+_SKIP_PART_RE = re.compile(r"floor|flat|door|shop|no[. ]|building|#", re.IGNORECASE)
 
 
 def _extract_city_area(location: str) -> str:
@@ -43,17 +93,61 @@ def _extract_city_area(location: str) -> str:
     '1st Floor, Office, HSR Layout, Bangalore' → 'HSR Layout, Bangalore'
     """
     parts = [p.strip() for p in location.split(",")]
-    skip_keywords = ["floor", "flat", "door", "shop", "no.", "no ", "building", "#"]
-    meaningful = [
-        p for p in parts
-        if len(p.strip()) >= 3
-        and not any(kw in p.lower() for kw in skip_keywords)
-    ]
+    meaningful = [p for p in parts if len(p) >= 3 and not _SKIP_PART_RE.search(p)]
     if len(meaningful) >= 2:
         return ", ".join(meaningful[-2:])
     return meaningful[-1] if meaningful else location
 
 
+async def _search_text(session, headers: dict, body: dict) -> tuple[dict, int]:
+    """POST one searchText request, retrying transient failures.
+
+    Returns (response json, latency ms across all attempts).
+    """
+    with timed() as t:
+        for attempt in range(SEARCH_ATTEMPTS):
+            last = attempt == SEARCH_ATTEMPTS - 1
+            try:
+                async with session.post(SEARCH_TEXT_URL, json=body, headers=headers) as resp:
+                    if last or resp.status not in _RETRY_HTTP_STATUSES:
+                        data = await resp.json(loads=orjson.loads, content_type=None)
+                        break
+                    logger.info(
+                        "Places search got HTTP %s for %r, retrying", resp.status, body["textQuery"],
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last:
+                    raise
+                logger.info("Places search error for %r, retrying: %s", body["textQuery"], e)
+            await asyncio.sleep(RETRY_BASE_DELAY_SEC * (2 ** attempt) + random.random() * 0.1)
+    return data, t.ms
+
+
+def _store_from_place(
+    place: dict, distance_from_user: Callable[[float, float], float] | None,
+) -> dict[str, Any]:
+    """Shape one searchText place into a store dict."""
+    geo = place.get("location") or {}
+    store_lat = geo.get("latitude")
+    store_lng = geo.get("longitude")
+    distance_km: float | None = None
+    if distance_from_user and store_lat and store_lng:
+        distance_km = round(distance_from_user(store_lat, store_lng), 2)
+
+    return {
+        "name": (place.get("displayName") or {}).get("text") or "Unknown",
+        "address": place.get("formattedAddress"),
+        "phone_number": place.get("internationalPhoneNumber") or place.get("nationalPhoneNumber"),
+        "rating": place.get("rating"),
+        "total_ratings": place.get("userRatingCount"),
+        "place_id": place["id"],
+        "latitude": store_lat,
+        "longitude": store_lng,
+        "is_open_now": (place.get("currentOpeningHours") or {}).get("openNow"),
+        "distance_km": distance_km,
+    }
+
+
 async def find_stores(
     ticket_id: str,
     store_search_query: str,
@@ -61,6 +155,8 @@ async def find_stores(
     max_stores: int | None = None,
     search_queries: list[str] | None = None,
     specific_store_name: str | None = None,
+    user_lat: float | None = None,
+    user_lng: float | None = None,
 ) -> list[dict[str, Any]]:
     """
     Search Google Maps using multiple strategies and merge results.
@@ -75,6 +171,9 @@ async def find_stores(
 
     Falls back to a single search using store_search_query if search_queries
     is not given.
+
+    Pass user_lat/user_lng when the caller already has the user's coordinates
+    to skip geocoding the location here.
     """
     max_stores = max_stores or Config.MAX_STORES_TO_CALL
     api_key = Config.GOOGLE_MAPS_API_KEY
@@ -84,158 +183,162 @@ async def find_stores(
     city_area = _extract_city_area(location)
 
     # Geocode user location for proximity bias and distance sorting
-    user_lat: float | None = None
-    user_lng: float | None = None
-    try:
-        user_geo = await geocode_address(location)
-        if user_geo:
-            user_lat = user_geo.get("lat")
-            user_lng = user_geo.get("lng")
-            logger.info("Ticket %s: user location geocoded to (%s, %s)", ticket_id, user_lat, user_lng)
-    except Exception:
-        logger.warning("Ticket %s: failed to geocode user location, skipping proximity bias", ticket_id)
+    if user_lat is None or user_lng is None:
+        user_lat = user_lng = None
+        try:
+            user_geo = await geocode_address(location)
+            if user_geo:
+                user_lat = user_geo.get("lat")
+                user_lng = user_geo.get("lng")
+                logger.info("Ticket %s: user location geocoded to (%s, %s)", ticket_id, user_lat, user_lng)
+        except Exception:
+            logger.warning("Ticket %s: failed to geocode user location, skipping proximity bias", ticket_id)
 
     queries = search_queries or [f"{store_search_query} near {location}"]
 
     if specific_store_name:
         bare = specific_store_name.strip()
         city_query = f"{bare} {city_area}"
-        prepend = []
-        if bare.lower() not in [q.lower().strip() for q in queries]:
-            prepend.append(bare)
-        if city_query.lower() not in [q.lower().strip() for q in queries]:
-            prepend.append(city_query)
+        existing = {q.lower().strip() for q in queries}
+        prepend = [c for c in (bare, city_query) if c.lower() not in existing]
         queries = prepend + queries
 
+    # Dedup on the final search text: adding " near <area>" can make two
+    # different inputs identical, and each duplicate is a billed request.
     queries_with_location = []
+    seen_queries: set[str] = set()
+    location_parts = _location_parts(location)
     for q in queries:
         low = q.lower()
-        if _has_location_overlap(q, location) or "near" in low:
-            queries_with_location.append(q)
-        else:
-            queries_with_location.append(f"{q} near {city_area}")
+        if not ("near" in low or _has_location_overlap(low, location_parts)):
+            q = f"{q} near {city_area}"
+        key = " ".join(q.lower().split())
+        if key in seen_queries:
+            continue
+        seen_queries.add(key)
+        queries_with_location.append(q)
 
     seen_place_ids: set[str] = set()
-    all_places: list[tuple[int, dict]] = []
-
-    async with aiohttp.ClientSession() as session:
+    # Bounded heap of the best max_stores*2 candidates by (priority, -rating,
+    # -reviews, arrival). Keys are stored negated so heap[0] is the worst kept
+    # entry and heappushpop evicts it; arrival order breaks ties (like a stable
+    # sort) and keeps place dicts out of comparisons.
+    keep = max_stores * 2
+    best: list[tuple[int, float, int, int, dict]] = []
+    arrival = 0
+
+    headers = {"X-Goog-Api-Key": api_key, "X-Goog-FieldMask": SEARCH_FIELD_MASK}
+    location_bias = None
+    if user_lat and user_lng:
+        location_bias = {"circle": {
+            "center": {"latitude": user_lat, "longitude": user_lng},
+            "radius": 50000.0,
+        }}
+
+    bodies = []
+    for search_text in queries_with_location:
+        body: dict[str, Any] = {"textQuery": search_text, "pageSize": MAX_RESULTS_PER_QUERY}
+        if location_bias:
+            body["locationBias"] = location_bias
+        bodies.append(body)
+
+    # Merge in priority order so dedup keeps the same (highest-priority) hit as
+    # a sequential walk would. Each search is a billed request, so later ones
+    # are started lazily: only while the heap has room, SEARCH_LOOKAHEAD ahead.
+    session = get_session()
+    tasks: list[asyncio.Task] = []
+    try:
         for priority, search_text in enumerate(queries_with_location):
-            start = time.time()
-            params: dict[str, Any] = {"query": search_text, "key": api_key}
-
-            if user_lat and user_lng:
-                params["location"] = f"{user_lat},{user_lng}"
-                params["radius"] = "50000"
-
-            async with session.get(TEXT_SEARCH_URL, params=params) as resp:
-                data = await resp.json()
+            # Candidates are ordered by priority first, so once the heap is full
+            # no lower-priority search can get a place into it.
+            if len(best) >= keep:
+                logger.info(
+                    "Ticket %s: %d candidates from the first %d searches, skipping the other %d (%d not sent)",
+                    ticket_id, len(best), priority, len(bodies) - priority, len(bodies) - len(tasks),
+                )
+                break
+            for body in bodies[len(tasks):priority + 1 + SEARCH_LOOKAHEAD]:
+                tasks.append(asyncio.create_task(_search_text(session, headers, body)))
+            try:
+                response = await tasks[priority]
+            except Exception as e:
+                response = e
+            if isinstance(response, BaseException):
+                logger.warning("Google Maps search failed for %r: %s", search_text, response)
+                log_sink.enqueue("tool_call", {
+                    "ticket_id": ticket_id, "tool_name": "google_maps_text_search",
+                    "input_params": {"query": search_text, "strategy_priority": priority},
+                    "output_result": {"error": str(response)},
+                    "status": "error", "error_message": str(response),
+                })
+                continue
 
-            if data.get("status") != "OK":
+            data, latency_ms = response
+            error = data.get("error")
+            if error:
                 logger.warning(
-                    "Google Maps search failed for %r: %s", search_text, data.get("status"),
-                )
-                log_tool_call(
-                    ticket_id, "google_maps_text_search",
-                    {"query": search_text, "strategy_priority": priority},
-                    {"status": data.get("status"), "error": data.get("error_message")},
-                    status="error", error_message=data.get("error_message"),
-                    latency_ms=int((time.time() - start) * 1000),
+                    "Google Maps search failed for %r: %s", search_text, error.get("status"),
                 )
+                log_sink.enqueue("tool_call", {
+                    "ticket_id": ticket_id, "tool_name": "google_maps_text_search",
+                    "input_params": {"query": search_text, "strategy_priority": priority},
+                    "output_result": {"status": error.get("status"), "error": error.get("message")},
+                    "status": "error", "error_message": error.get("message"),
+                    "latency_ms": latency_ms,
+                })
                 continue
 
-            results = data.get("results") or []
-            results.sort(
-                key=lambda r: (r.get("rating") or 0, r.get("user_ratings_total") or 0),
-                reverse=True,
-            )
+            # No per-query sort: the heap orders by (priority, rating, reviews).
+            results = data.get("places") or []
 
             new_count = 0
             for place in results:
-                pid = place.get("place_id")
+                pid = place.get("id")
                 if not pid or pid in seen_place_ids:
                     continue
                 seen_place_ids.add(pid)
-                all_places.append((priority, place))
                 new_count += 1
-
-            log_tool_call(
-                ticket_id, "google_maps_text_search",
-                {"query": search_text, "strategy_priority": priority},
-                {"total_found": len(results), "new_unique": new_count},
-                latency_ms=int((time.time() - start) * 1000),
-            )
-
-        all_places.sort(key=lambda x: (
-            x[0],
-            -(x[1].get("rating") or 0),
-            -(x[1].get("user_ratings_total") or 0),
-        ))
-        top = all_places[:max_stores * 2]
-
-        stores: list[dict[str, Any]] = []
-        for _priority, place in top:
-            place_id = place.get("place_id")
-            if not place_id:
-                continue
-            detail_start = time.time()
-            detail_params = {
-                "place_id": place_id,
-                "fields": (
-                    "formatted_phone_number,international_phone_number,"
-                    "name,rating,user_ratings_total,formatted_address,"
-                    "geometry,opening_hours,business_status,types"
-                ),
-                "key": api_key,
-            }
-            async with session.get(PLACE_DETAILS_URL, params=detail_params) as dresp:
-                ddata = await dresp.json()
-
-            detail = ddata.get("result") or {}
-            phone = detail.get("international_phone_number") or detail.get("formatted_phone_number")
-            geo = detail.get("geometry", {}).get("location", {})
-            hours = detail.get("opening_hours", {})
-
-            store_lat = geo.get("lat")
-            store_lng = geo.get("lng")
-            distance_km: float | None = None
-            if user_lat and user_lng and store_lat and store_lng:
-                distance_km = round(_haversine_km(user_lat, user_lng, store_lat, store_lng), 2)
-
-            store = {
-                "name": detail.get("name") or place.get("name", "Unknown"),
-                "address": detail.get("formatted_address") or place.get("formatted_address"),
-                "phone_number": phone,
-                "rating": detail.get("rating") or place.get("rating"),
-                "total_ratings": detail.get("user_ratings_total") or place.get("user_ratings_total"),
-                "place_id": place_id,
-                "latitude": store_lat,
-                "longitude": store_lng,
-                "is_open_now": hours.get("open_now"),
-                "business_status": detail.get("business_status"),
-                "place_types": detail.get("types", []),
-                "distance_km": distance_km,
-            }
-            stores.append(store)
-
-            log_tool_call(
-                ticket_id, "google_maps_place_details",
-                {"place_id": place_id},
-                {"name": store["name"], "phone": phone, "open_now": store["is_open_now"],
-                 "distance_km": distance_km},
-                latency_ms=int((time.time() - detail_start) * 1000),
-            )
-
-            if len([s for s in stores if s.get("phone_number")]) >= max_stores:
-                break
-
-    callable_stores = [
-        s for s in stores
-        if s.get("phone_number") and s.get("is_open_now") is not False
-    ]
-    closed_count = sum(
-        1 for s in stores
-        if s.get("phone_number") and s.get("is_open_now") is False
-    )
+                entry = (-priority, place.get("rating") or 0, place.get("userRatingCount") or 0, -arrival, place)
+                arrival += 1
+                if len(best) < keep:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heappushpop(best, entry)
+
+            log_sink.enqueue("tool_call", {
+                "ticket_id": ticket_id, "tool_name": "google_maps_text_search",
+                "input_params": {"query": search_text, "strategy_priority": priority},
+                "output_result": {"total_found": len(results), "new_unique": new_count},
+                "latency_ms": latency_ms,
+            })
+    finally:
+        for task in tasks:
+            # Finished-but-skipped tasks: mark any error as retrieved.
+            if not task.cancel() and not task.cancelled():
+                task.exception()
+
+    top = [entry[-1] for entry in sorted(best, reverse=True)]
+
+    distance_from_user = _distance_from(user_lat, user_lng) if user_lat and user_lng else None
+    stores: list[dict[str, Any]] = []
+    with_phone = 0
+    for place in top:
+        if with_phone >= max_stores:
+            break
+        store = _store_from_place(place, distance_from_user)
+        stores.append(store)
+        if store["phone_number"]:
+            with_phone += 1
+
+    callable_stores: list[dict[str, Any]] = []
+    closed_count = 0
+    for s in stores:
+        if not s["phone_number"]:
+            continue
+        if s["is_open_now"] is False:
+            closed_count += 1
+        else:
+            callable_stores.append(s)
     if closed_count:
         logger.info(
             "Ticket %s: skipped %d store(s) that Google Maps reports as currently closed",
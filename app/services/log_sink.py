@@ -0,0 +1,109 @@
+"""Background sink for tool/LLM call logs so request paths don't wait on inserts."""
+import asyncio
+import logging
+from typing import Any
+
+from app.db.tickets import log_tool_calls, log_llm_calls
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX = 100
+# Past this backlog, enqueue() drops rows instead of growing the queue.
+HIGH_WATERMARK = 5000
+DROP_WARN_EVERY = 1000
+STOP_TIMEOUT_SEC = 10
+
+_WRITERS = {
+    "tool_call": log_tool_calls,
+    "llm_call": log_llm_calls,
+}
+
+_queue: asyncio.Queue | None = None
+_task: asyncio.Task | None = None
+_dropped = 0
+
+
+def _write(kind: str, rows: list[dict[str, Any]]) -> None:
+    try:
+        _WRITERS[kind](rows)
+    except Exception:
+        logger.exception("Failed to write %d %s log(s)", len(rows), kind)
+
+
+def enqueue(kind: str, row: dict[str, Any]) -> None:
+    """Queue one log row (kwargs of log_tool_call / log_llm_call) for batched insert.
+
+    Never blocks the event loop. Rows are dropped (and counted) while the queue
+    is backed up; without a running sink they are written from a worker thread,
+    or inline when there is no event loop at all.
+    """
+    global _dropped
+    if _queue is None or _task is None or _task.done():
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _write(kind, [row])
+        else:
+            loop.run_in_executor(None, _write, kind, [row])
+        return
+    if _queue.qsize() >= HIGH_WATERMARK:
+        _dropped += 1
+        if _dropped % DROP_WARN_EVERY == 1:
+            logger.warning("Log sink backed up; %d log row(s) dropped so far", _dropped)
+        return
+    _queue.put_nowait((kind, row))
+
+
+async def _flush(batch: list[tuple[str, dict[str, Any]]]) -> None:
+    by_kind: dict[str, list[dict[str, Any]]] = {}
+    for kind, row in batch:
+        by_kind.setdefault(kind, []).append(row)
+    for kind, rows in by_kind.items():
+        await asyncio.to_thread(_write, kind, rows)
+
+
+async def _run_sink() -> None:
+    while True:
+        item = await _queue.get()
+        if item is None:
+            return
+        batch = [item]
+        stop = False
+        while len(batch) < BATCH_MAX:
+            try:
+                item = _queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        await _flush(batch)
+        if stop:
+            return
+
+
+def start_log_sink() -> asyncio.Task | None:
+    global _queue, _task
+    if _task is not None and not _task.done():
+        return _task
+    _queue = asyncio.Queue()
+    _task = asyncio.create_task(_run_sink())
+    logger.info("Log sink started (batch=%d)", BATCH_MAX)
+    return _task
+
+
+async def stop_log_sink() -> None:
+    """Drain queued logs and stop the worker."""
+    global _queue, _task
+    if _task is None:
+        return
+    if not _task.done():
+        _queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(_task, STOP_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            logger.warning("Log sink did not drain within %ss", STOP_TIMEOUT_SEC)
+    _queue = None
+    _task = None
+    logger.info("Log sink stopped")
@@ -1,4 +1,5 @@
 """ProRouting Logistics API client – quotes, order creation, and order placement orchestration."""
+import asyncio
 import logging
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -7,6 +8,7 @@ from typing import Any, Optional
 import aiohttp
 
 from app.helpers.config import Config
+from app.helpers.http_client import get_session
 from app.db.tickets import (
     get_ticket,
     get_product,
@@ -20,11 +22,15 @@ from app.db.tickets import (
     get_failed_lsp_ids,
 )
 from app.services.geocoding import geocode_address, reverse_geocode, extract_pincode
+from app.services.options_summary import option_sort_key
 
 logger = logging.getLogger(__name__)
 
 IST = timezone(timedelta(hours=5, minutes=30))
 
+# Per-request cap; the shared session itself has no total timeout.
+_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
 
 def _headers() -> dict[str, str]:
     return {
@@ -78,21 +84,33 @@ async def get_delivery_quotes(
     url = f"{_base_url()}/partner/quotes"
     logger.info("ProRouting /quotes request: %s", payload)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=_headers()) as resp:
-            data = await resp.json()
+    async with get_session().post(url, json=payload, headers=_headers(), timeout=_TIMEOUT) as resp:
+        data = await resp.json()
 
     logger.info("ProRouting /quotes response status=%s, quotes=%d",
                 data.get("status"), len(data.get("quotes", [])))
     return data
 
 
+def _cheapest_quote(
+    quotes: list[dict[str, Any]], exclude_lsps: frozenset[str] | set[str] = frozenset(),
+) -> Optional[dict[str, Any]]:
+    """Cheapest quote by price_forward in one pass, skipping excluded LSP ids."""
+    best = None
+    best_price = float("inf")
+    for q in quotes:
+        if exclude_lsps and q.get("lsp_id") in exclude_lsps:
+            continue
+        price = q.get("price_forward")
+        price = float(price) if price is not None else 999999.0
+        if price < best_price:
+            best, best_price = q, price
+    return best
+
+
 def find_cheapest_quote(quotes_response: dict[str, Any]) -> Optional[dict[str, Any]]:
     """Pick the cheapest quote by price_forward from a /quotes response."""
-    quotes = quotes_response.get("quotes", [])
-    if not quotes:
-        return None
-    return min(quotes, key=lambda q: float(q.get("price_forward", 999999)))
+    return _cheapest_quote(quotes_response.get("quotes") or [])
 
 
 async def create_delivery_order(
@@ -139,9 +157,8 @@ async def create_delivery_order(
     url = f"{_base_url()}/partner/order/createasync"
     logger.info("ProRouting /createasync request for %s (lsp=%s)", client_order_id, selected_lsp_id)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=_headers()) as resp:
-            data = await resp.json()
+    async with get_session().post(url, json=payload, headers=_headers(), timeout=_TIMEOUT) as resp:
+        data = await resp.json()
 
     logger.info("ProRouting /createasync response: %s", data)
     return data
@@ -152,9 +169,8 @@ async def get_order_status(prorouting_order_id: str) -> dict[str, Any]:
     url = f"{_base_url()}/partner/order/status"
     payload = {"order_id": prorouting_order_id}
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=_headers()) as resp:
-            return await resp.json()
+    async with get_session().post(url, json=payload, headers=_headers(), timeout=_TIMEOUT) as resp:
+        return await resp.json()
 
 
 async def get_order_tracking(prorouting_order_id: str) -> dict[str, Any]:
@@ -162,9 +178,8 @@ async def get_order_tracking(prorouting_order_id: str) -> dict[str, Any]:
     url = f"{_base_url()}/partner/order/track"
     payload = {"order_id": prorouting_order_id}
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=_headers()) as resp:
-            return await resp.json()
+    async with get_session().post(url, json=payload, headers=_headers(), timeout=_TIMEOUT) as resp:
+        return await resp.json()
 
 
 # ---------------------------------------------------------------------------
@@ -172,7 +187,7 @@ async def get_order_tracking(prorouting_order_id: str) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 def _build_options_for_confirm(calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    """Same sorting logic as options_summary._build_options to ensure consistent option indices."""
+    """Same filter and order as options_summary._build_options to ensure consistent option indices."""
     options = []
     for c in calls:
         if c.get("status") != "analyzed" or not c.get("product_available"):
@@ -190,17 +205,22 @@ def _build_options_for_confirm(calls: list[dict[str, Any]]) -> list[dict[str, An
             "specs_match_score": analysis.get("specs_match_score"),
         })
 
-    match_weight = {"exact": 4, "close": 3, "alternative": 2, "no_match": 0, "no_data": 0}
-    options.sort(
-        key=lambda o: (
-            -(match_weight.get(o.get("product_match_type") or "", 0) * 3
-              + float(o.get("specs_match_score") or 0) * 2),
-            o.get("price") or 999999,
-        )
-    )
+    options.sort(key=option_sort_key)
     return options
 
 
+async def _resolve_pickup_pincode(
+    store_address: str, pickup_lat: Optional[float], pickup_lng: Optional[float],
+) -> Optional[str]:
+    """Pincode from the store address text, else from reverse-geocoding its coordinates."""
+    pickup_pincode = extract_pincode(store_address)
+    if not pickup_pincode and pickup_lat and pickup_lng:
+        store_geo = await reverse_geocode(pickup_lat, pickup_lng)
+        if store_geo:
+            pickup_pincode = store_geo.get("pincode")
+    return pickup_pincode
+
+
 async def place_order(
     ticket_id: str,
     *,
@@ -217,12 +237,16 @@ async def place_order(
     5. Create delivery order via ProRouting
     6. Update DB with order details
     """
-    ticket = get_ticket(ticket_id)
+    # Sync DB helpers run in worker threads so concurrent orders and webhooks
+    # aren't stalled behind them on the event loop.
+    ticket, product, all_calls = await asyncio.gather(
+        asyncio.to_thread(get_ticket, ticket_id),
+        asyncio.to_thread(get_product, ticket_id),
+        asyncio.to_thread(get_store_calls_for_ticket, ticket_id),
+    )
     if not ticket:
         raise ValueError(f"Ticket {ticket_id} not found")
 
-    product = get_product(ticket_id)
-    all_calls = get_store_calls_for_ticket(ticket_id)
     options = _build_options_for_confirm(all_calls)
 
     chosen = None
@@ -230,20 +254,20 @@ async def place_order(
     if store_call_id:
         chosen = next((o for o in options if o["store_call_id"] == store_call_id), None)
         if not chosen:
-            update_ticket_status(ticket_id, "failed", error_message=f"store_call_id {store_call_id} not found among available options")
+            await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=f"store_call_id {store_call_id} not found among available options")
             return
     elif selected_option:
         if selected_option < 1 or selected_option > len(options):
-            update_ticket_status(ticket_id, "failed", error_message=f"Invalid option {selected_option}, only {len(options)} available")
+            await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=f"Invalid option {selected_option}, only {len(options)} available")
             return
         chosen = options[selected_option - 1]
     else:
-        update_ticket_status(ticket_id, "failed", error_message="No store_call_id or selected_option provided")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message="No store_call_id or selected_option provided")
         return
 
-    store = get_store_by_id(chosen["store_id"])
+    store = await asyncio.to_thread(get_store_by_id, chosen["store_id"])
     if not store:
-        update_ticket_status(ticket_id, "failed", error_message="Selected store not found in DB")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message="Selected store not found in DB")
         return
 
     product_name = product["product_name"] if product else "Item"
@@ -251,12 +275,18 @@ async def place_order(
     if product_price > 1000:
         product_price = 999
 
-    # --- Geocode customer delivery location ---
-    update_ticket_status(ticket_id, "placing_order")
+    # --- Geocode customer delivery location + resolve store pickup pincode ---
+    await asyncio.to_thread(update_ticket_status, ticket_id, "placing_order")
     customer_location = ticket.get("location", "")
-    customer_geo = await geocode_address(customer_location)
+    pickup_lat = store.get("latitude")
+    pickup_lng = store.get("longitude")
+    store_address = store.get("address") or ""
+    customer_geo, pickup_pincode = await asyncio.gather(
+        geocode_address(customer_location),
+        _resolve_pickup_pincode(store_address, pickup_lat, pickup_lng),
+    )
     if not customer_geo or not customer_geo.get("lat"):
-        update_ticket_status(ticket_id, "failed", error_message=f"Could not geocode customer location: {customer_location}")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=f"Could not geocode customer location: {customer_location}")
         return
 
     drop_lat = customer_geo["lat"]
@@ -265,17 +295,6 @@ async def place_order(
     drop_city = customer_geo.get("city") or ""
     drop_state = customer_geo.get("state") or ""
 
-    # --- Get store pickup pincode ---
-    pickup_lat = store.get("latitude")
-    pickup_lng = store.get("longitude")
-    store_address = store.get("address") or ""
-    pickup_pincode = extract_pincode(store_address)
-
-    if not pickup_pincode and pickup_lat and pickup_lng:
-        store_geo = await reverse_geocode(pickup_lat, pickup_lng)
-        if store_geo:
-            pickup_pincode = store_geo.get("pincode")
-
     pickup_pincode = pickup_pincode or "000000"
     city = drop_city or customer_location.split(",")[-1].strip()
 
@@ -283,49 +302,55 @@ async def place_order(
     short_uid = uuid.uuid4().hex[:8]
     client_order_id = f"{ticket_id}_{short_uid}"
 
-    # --- Create logistics_order record in DB ---
-    logistics_id = create_logistics_order(
-        ticket_id=ticket_id,
-        store_call_id=chosen["store_call_id"],
-        client_order_id=client_order_id,
+    # --- Get delivery quotes while the logistics_order row is written ---
+    quotes_task = asyncio.create_task(get_delivery_quotes(
         pickup_lat=pickup_lat,
         pickup_lng=pickup_lng,
-        pickup_address=store_address,
         pickup_pincode=pickup_pincode,
-        pickup_phone=store.get("phone_number"),
         drop_lat=drop_lat,
         drop_lng=drop_lng,
-        drop_address=customer_geo.get("formatted_address", customer_location),
         drop_pincode=drop_pincode,
-        drop_phone=ticket.get("user_phone"),
-        customer_name=customer_name or ticket.get("user_phone"),
+        city=city,
         order_amount=product_price,
         order_weight=1.0,
-    )
+    ))
 
-    # --- Get delivery quotes ---
     try:
-        quotes_resp = await get_delivery_quotes(
+        logistics_id = await asyncio.to_thread(
+            create_logistics_order,
+            ticket_id=ticket_id,
+            store_call_id=chosen["store_call_id"],
+            client_order_id=client_order_id,
             pickup_lat=pickup_lat,
             pickup_lng=pickup_lng,
+            pickup_address=store_address,
             pickup_pincode=pickup_pincode,
+            pickup_phone=store.get("phone_number"),
             drop_lat=drop_lat,
             drop_lng=drop_lng,
+            drop_address=customer_geo.get("formatted_address", customer_location),
             drop_pincode=drop_pincode,
-            city=city,
+            drop_phone=ticket.get("user_phone"),
+            customer_name=customer_name or ticket.get("user_phone"),
             order_amount=product_price,
             order_weight=1.0,
         )
+    except BaseException:
+        quotes_task.cancel()
+        raise
+
+    try:
+        quotes_resp = await quotes_task
     except Exception as e:
         logger.exception("ProRouting /quotes failed for ticket %s", ticket_id)
-        update_logistics_order_error(logistics_id, f"Quotes API failed: {e}")
-        update_ticket_status(ticket_id, "failed", error_message=f"Delivery quotes failed: {e}")
+        await asyncio.to_thread(update_logistics_order_error, logistics_id, f"Quotes API failed: {e}")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=f"Delivery quotes failed: {e}")
         return
 
     if quotes_resp.get("status") != 1 or not quotes_resp.get("quotes"):
         msg = quotes_resp.get("message", "No delivery partners available for this route")
-        update_logistics_order_error(logistics_id, msg)
-        update_ticket_status(ticket_id, "failed", error_message=msg)
+        await asyncio.to_thread(update_logistics_order_error, logistics_id, msg)
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=msg)
         return
 
     cheapest = find_cheapest_quote(quotes_resp)
@@ -389,14 +414,14 @@ async def place_order(
         )
     except Exception as e:
         logger.exception("ProRouting /createasync failed for ticket %s", ticket_id)
-        update_logistics_order_error(logistics_id, f"Create order failed: {e}")
-        update_ticket_status(ticket_id, "failed", error_message=f"Delivery order creation failed: {e}")
+        await asyncio.to_thread(update_logistics_order_error, logistics_id, f"Create order failed: {e}")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=f"Delivery order creation failed: {e}")
         return
 
     if order_resp.get("status") != 1:
         msg = order_resp.get("message", "Order creation failed")
-        update_logistics_order_error(logistics_id, msg)
-        update_ticket_status(ticket_id, "failed", error_message=msg)
+        await asyncio.to_thread(update_logistics_order_error, logistics_id, msg)
+        await asyncio.to_thread(update_ticket_status, ticket_id, "failed", error_message=msg)
         return
 
     # --- Success: update DB with order details ---
@@ -404,7 +429,8 @@ async def place_order(
     prorouting_order_id = order_data.get("id", "")
     order_state = order_data.get("state", "UnFulfilled")
 
-    update_logistics_order_placed(
+    await asyncio.to_thread(
+        update_logistics_order_placed,
         logistics_order_id=logistics_id,
         prorouting_order_id=prorouting_order_id,
         order_state=order_state,
@@ -414,7 +440,7 @@ async def place_order(
         quoted_price=float(cheapest.get("price_forward", 0)),
     )
 
-    update_ticket_status(ticket_id, "order_placed")
+    await asyncio.to_thread(update_ticket_status, ticket_id, "order_placed")
     logger.info(
         "Ticket %s: delivery order placed! prorouting_id=%s, lsp=%s, price=₹%s",
         ticket_id, prorouting_order_id,
@@ -443,12 +469,14 @@ async def retry_delivery(ticket_id: str) -> None:
     Retry delivery with the next available LSP after a cancellation.
     Re-quotes, excludes previously failed LSPs, picks the cheapest remaining.
     """
-    order = get_logistics_order(ticket_id)
+    order, failed_lsps = await asyncio.gather(
+        asyncio.to_thread(get_logistics_order, ticket_id),
+        asyncio.to_thread(get_failed_lsp_ids, ticket_id),
+    )
     if not order:
         logger.error("Ticket %s: no logistics order found for retry", ticket_id)
         return
 
-    failed_lsps = get_failed_lsp_ids(ticket_id)
     max_retries = Config.MAX_DELIVERY_RETRIES
 
     if len(failed_lsps) >= max_retries:
@@ -456,7 +484,8 @@ async def retry_delivery(ticket_id: str) -> None:
             "Ticket %s: max delivery retries (%d) reached, giving up. Failed LSPs: %s",
             ticket_id, max_retries, failed_lsps,
         )
-        update_ticket_status(
+        await asyncio.to_thread(
+            update_ticket_status,
             ticket_id, "delivery_failed",
             error_message=f"All delivery attempts failed after {len(failed_lsps)} retries",
         )
@@ -466,7 +495,7 @@ async def retry_delivery(ticket_id: str) -> None:
         "Ticket %s: retrying delivery (attempt %d/%d, excluding LSPs: %s)",
         ticket_id, len(failed_lsps) + 1, max_retries, failed_lsps,
     )
-    update_ticket_status(ticket_id, "retrying_delivery")
+    await asyncio.to_thread(update_ticket_status, ticket_id, "retrying_delivery")
 
     pickup_lat = order["pickup_lat"]
     pickup_lng = order["pickup_lng"]
@@ -489,25 +518,25 @@ async def retry_delivery(ticket_id: str) -> None:
         )
     except Exception as e:
         logger.exception("Ticket %s: re-quote failed during retry", ticket_id)
-        update_ticket_status(ticket_id, "delivery_failed", error_message=f"Retry quotes failed: {e}")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "delivery_failed", error_message=f"Retry quotes failed: {e}")
         return
 
     if quotes_resp.get("status") != 1 or not quotes_resp.get("quotes"):
         msg = quotes_resp.get("message", "No delivery partners available on retry")
-        update_ticket_status(ticket_id, "delivery_failed", error_message=msg)
+        await asyncio.to_thread(update_ticket_status, ticket_id, "delivery_failed", error_message=msg)
         return
 
     # --- Filter out failed LSPs and pick cheapest ---
-    available = [q for q in quotes_resp["quotes"] if q.get("lsp_id") not in failed_lsps]
-    if not available:
+    cheapest = _cheapest_quote(quotes_resp["quotes"], set(failed_lsps))
+    if cheapest is None:
         logger.warning("Ticket %s: no LSPs left after excluding %s", ticket_id, failed_lsps)
-        update_ticket_status(
+        await asyncio.to_thread(
+            update_ticket_status,
             ticket_id, "delivery_failed",
             error_message=f"No delivery partners left (excluded {len(failed_lsps)} failed LSPs)",
         )
         return
 
-    cheapest = min(available, key=lambda q: float(q.get("price_forward", 999999)))
     quote_id = quotes_resp.get("quote_id")
 
     logger.info(
@@ -520,7 +549,8 @@ async def retry_delivery(ticket_id: str) -> None:
     short_uid = uuid.uuid4().hex[:8]
     client_order_id = f"{ticket_id}_{short_uid}"
 
-    logistics_id = create_logistics_order(
+    logistics_id = await asyncio.to_thread(
+        create_logistics_order,
         ticket_id=ticket_id,
         store_call_id=order["store_call_id"],
         client_order_id=client_order_id,
@@ -575,7 +605,7 @@ async def retry_delivery(ticket_id: str) -> None:
 
     callback_url = f"{Config.VAPI_SERVER_URL}/api/logistics/callback"
 
-    product = get_product(ticket_id)
+    product = await asyncio.to_thread(get_product, ticket_id)
     product_name = product["product_name"] if product else "Item"
 
     order_items = [{
@@ -599,14 +629,14 @@ async def retry_delivery(ticket_id: str) -> None:
         )
     except Exception as e:
         logger.exception("Ticket %s: retry create order failed", ticket_id)
-        update_logistics_order_error(logistics_id, f"Retry create order failed: {e}")
-        update_ticket_status(ticket_id, "delivery_failed", error_message=f"Retry order creation failed: {e}")
+        await asyncio.to_thread(update_logistics_order_error, logistics_id, f"Retry create order failed: {e}")
+        await asyncio.to_thread(update_ticket_status, ticket_id, "delivery_failed", error_message=f"Retry order creation failed: {e}")
         return
 
     if order_resp.get("status") != 1:
         msg = order_resp.get("message", "Retry order creation failed")
-        update_logistics_order_error(logistics_id, msg)
-        update_ticket_status(ticket_id, "delivery_failed", error_message=msg)
+        await asyncio.to_thread(update_logistics_order_error, logistics_id, msg)
+        await asyncio.to_thread(update_ticket_status, ticket_id, "delivery_failed", error_message=msg)
         return
 
     # --- Success ---
@@ -614,7 +644,8 @@ async def retry_delivery(ticket_id: str) -> None:
     new_prorouting_id = order_data.get("id", "")
     new_state = order_data.get("state", "UnFulfilled")
 
-    update_logistics_order_placed(
+    await asyncio.to_thread(
+        update_logistics_order_placed,
         logistics_order_id=logistics_id,
         prorouting_order_id=new_prorouting_id,
         order_state=new_state,
@@ -624,7 +655,7 @@ async def retry_delivery(ticket_id: str) -> None:
         quoted_price=float(cheapest.get("price_forward", 0)),
     )
 
-    update_ticket_status(ticket_id, "order_placed")
+    await asyncio.to_thread(update_ticket_status, ticket_id, "order_placed")
     logger.info(
         "Ticket %s: RETRY delivery placed! prorouting_id=%s, lsp=%s, price=₹%s (attempt %d)",
         ticket_id, new_prorouting_id,
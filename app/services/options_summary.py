@@ -57,6 +57,18 @@ def _format_transcript(option: dict[str, Any]) -> str:
     return "    (no transcript available)"
 
 
+_MATCH_TYPE_WEIGHT = {"exact": 4, "close": 3, "alternative": 2, "no_match": 0, "no_data": 0}
+
+
+def option_sort_key(option: dict[str, Any]) -> tuple[float, float]:
+    """Best match first, then cheapest. Shared with logistics so option numbers line up."""
+    return (
+        -(_MATCH_TYPE_WEIGHT.get(option.get("product_match_type") or "", 0) * 3
+          + float(option.get("specs_match_score") or 0) * 2),
+        option.get("price") or 999999,
+    )
+
+
 def _build_options(calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
     """Filter to successful calls and shape them into clean option dicts."""
     options = []
@@ -88,14 +100,7 @@ def _build_options(calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
         }
         options.append(option)
 
-    match_type_weight = {"exact": 4, "close": 3, "alternative": 2, "no_match": 0, "no_data": 0}
-    options.sort(
-        key=lambda o: (
-            -(match_type_weight.get(o.get("product_match_type") or "", 0) * 3
-              + float(o.get("specs_match_score") or 0) * 2),
-            o.get("price") or 999999,
-        )
-    )
+    options.sort(key=option_sort_key)
     return options
 
 